@@ -0,0 +1,85 @@
+"""Memory-budgeted admission control based on decoded pixel size."""
+
+from __future__ import annotations
+
+import io
+import threading
+from typing import Iterable
+
+from PIL import Image
+
+from engine import Size, Source, fit_size
+
+# Bytes per pixel of the decoded JPEG for each mode libjpeg can produce.
+DECODE_BANDS = {"1": 1, "L": 1, "RGB": 3, "YCbCr": 3, "CMYK": 4}
+# Working memory of one encode (input conversion, YUV planes, encoder
+# state) per output pixel; deliberately conservative.
+ENCODER_BYTES_PER_PIXEL = {"webp": 5, "avif": 4}
+
+
+def probe(source: Source) -> tuple[Size, str]:
+    """Read dimensions and mode from the JPEG header without decoding pixels."""
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    with Image.open(fp) as im:
+        return im.size, im.mode
+
+
+def _draft_size(size: Size, target: Size) -> Size:
+    # Mirrors libjpeg's scale-on-decode: 1/2, 1/4 or 1/8, never below target.
+    scale = 1
+    while scale < 8 and size[0] // (scale * 2) >= target[0] and size[1] // (scale * 2) >= target[1]:
+        scale *= 2
+    return -(-size[0] // scale), -(-size[1] // scale)
+
+
+def estimate_peak_bytes(size: Size, mode: str, formats: Iterable[str], max_size: Size | None = None) -> int:
+    """Estimate peak memory of one task: decode + RGB copy + the largest encode."""
+    target = fit_size(size, max_size) if max_size else size
+    decoded = _draft_size(size, target) if target != size else size
+    pixels = decoded[0] * decoded[1]
+
+    peak = pixels * DECODE_BANDS.get(mode, 4)
+    if mode != "RGB":
+        peak += pixels * 3
+    if target != decoded:
+        peak += target[0] * target[1] * 3
+    out_pixels = target[0] * target[1]
+    peak += max((ENCODER_BYTES_PER_PIXEL.get(fmt, 5) for fmt in formats), default=0) * out_pixels
+    return peak
+
+
+def estimate_source(source: Source, formats: Iterable[str], max_size: Size | None = None) -> int:
+    try:
+        size, mode = probe(source)
+    except Exception:
+        # Unreadable files fail fast in the decoder; don't hold budget for them.
+        return 0
+    return estimate_peak_bytes(size, mode, formats, max_size)
+
+
+class MemoryBudget:
+    """Admit tasks only while their estimated peak bytes fit under ``limit``.
+
+    A task larger than the whole budget is still admitted, but only once
+    nothing else is running, so it cannot deadlock the queue.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int) -> int:
+        nbytes = min(nbytes, self.limit)
+        with self._cond:
+            while self.used and self.used + nbytes > self.limit:
+                self._cond.wait()
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+        return nbytes
+
+    def release(self, nbytes: int) -> None:
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
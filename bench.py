@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""Benchmark the CLI, Tk and web conversion paths on a reproducible synthetic JPEG corpus."""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import functools
+import itertools
+import json
+import os
+import platform
+import queue
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List
+
+import PIL
+from PIL import Image
+
+from engine import EFFORT_PRESETS, EXTENSIONS, EncodeSettings, plan_threads
+from profiling import percentile
+
+CORPUS_VERSION = 1
+CORPUS_MANIFEST = "corpus.json"
+# Every source variant the converters must handle; cycled through the corpus.
+KINDS = ("baseline", "progressive", "grayscale", "cmyk", "exif")
+SIZES = ((640, 480), (1280, 853), (1600, 1067), (2048, 1365), (3000, 2000))
+PATHS = ("cli", "tk", "web")
+
+
+def synth_image(rng: random.Random, size: tuple[int, int]) -> Image.Image:
+    """Photo-like RGB content: smooth colour fields plus fine grain, fully seeded."""
+    width, height = size
+    bands = []
+    for _ in range(3):
+        coarse = (max(2, width // 48), max(2, height // 48))
+        field = Image.frombytes("L", coarse, rng.randbytes(coarse[0] * coarse[1]))
+        field = field.resize(size, Image.Resampling.BICUBIC)
+        grain = Image.frombytes("L", size, rng.randbytes(width * height))
+        bands.append(Image.blend(field, grain, 0.12))
+    return Image.merge("RGB", bands)
+
+
+def exif_block(rng: random.Random, index: int) -> Image.Exif:
+    exif = Image.Exif()
+    exif[0x010F] = "BenchCam"  # Make
+    exif[0x0110] = f"Model {index % 7}"  # Model
+    exif[0x0131] = "bench.py"  # Software
+    exif[0x0132] = "2024:01:01 12:00:00"  # DateTime
+    exif[0x010E] = "synthetic " * 200  # ImageDescription
+    # A large maker-note-sized blob, like the ones phones embed.
+    exif[0x927C] = rng.randbytes(48 * 1024)  # MakerNote
+    return exif
+
+
+def generate_corpus(root: Path, count: int, seed: int, quality: int = 90) -> List[Dict[str, Any]]:
+    """Write ``count`` JPEGs to ``root`` and return their descriptions; same seed, same corpus."""
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    images = []
+    for index in range(count):
+        kind = KINDS[index % len(KINDS)]
+        width, height = SIZES[rng.randrange(len(SIZES))]
+        if rng.random() < 0.3:
+            width, height = height, width
+        im = synth_image(rng, (width, height))
+
+        params: Dict[str, Any] = {"quality": quality}
+        if kind == "progressive":
+            params["progressive"] = True
+        elif kind == "grayscale":
+            im = im.convert("L")
+        elif kind == "cmyk":
+            im = im.convert("CMYK")
+        elif kind == "exif":
+            params["exif"] = exif_block(rng, index).tobytes()
+
+        path = root / f"bench_{index:04d}_{kind}.jpg"
+        im.save(path, format="JPEG", **params)
+        images.append(
+            {"file": path.name, "kind": kind, "width": width, "height": height, "bytes": path.stat().st_size}
+        )
+
+    with (root / CORPUS_MANIFEST).open("w", encoding="utf-8") as fh:
+        json.dump({"version": CORPUS_VERSION, "seed": seed, "count": count, "images": images}, fh, indent=2)
+        fh.write("\n")
+    return images
+
+
+def load_corpus(root: Path, count: int, seed: int) -> List[Path]:
+    """Reuse the corpus in ``root`` when it matches ``count`` and ``seed``, else regenerate it."""
+    try:
+        with (root / CORPUS_MANIFEST).open("r", encoding="utf-8") as fh:
+            spec = json.load(fh)
+        current = (spec.get("version"), spec.get("seed"), spec.get("count")) == (CORPUS_VERSION, seed, count)
+        images = spec["images"] if current else None
+    except (OSError, ValueError, KeyError):
+        images = None
+
+    if images is None or not all((root / entry["file"]).exists() for entry in images):
+        print(f"[BENCH] Generating {count} images in {root} (seed {seed})", file=sys.stderr)
+        images = generate_corpus(root, count, seed)
+    return [root / entry["file"] for entry in images]
+
+
+def peak_rss_bytes() -> int | None:
+    """Peak resident set size of this process and its finished children."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def _timed(func: Callable[..., Any], samples: List[float], *args: Any, **kwargs: Any) -> Any:
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        samples.append(time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def timing(module: Any, name: str, samples: List[float]) -> Iterator[None]:
+    """Record the wall time of every call to ``module.name`` while the block runs."""
+    original = getattr(module, name)
+    setattr(module, name, functools.partial(_timed, original, samples))
+    try:
+        yield
+    finally:
+        setattr(module, name, original)
+
+
+def run_cli(
+    files: List[Path], fmt: str, settings: EncodeSettings, workers: int, out: Path, samples: List[float]
+) -> int:
+    from converter import build_output_path, run_ordered
+    from engine import convert_file
+
+    tasks = ((src, [(fmt, build_output_path(src, out, EXTENSIONS[fmt]))]) for src in files)
+    func = functools.partial(_timed, convert_file, samples)
+    done = 0
+    converted = run_ordered(func, tasks, jobs=workers, executor="thread", settings=settings, overwrite=True)
+    for _src, results in converted:
+        done += sum(result.status == "ok" for result in results)
+    return done
+
+
+def run_tk(
+    files: List[Path], fmt: str, settings: EncodeSettings, workers: int, out: Path, samples: List[float]
+) -> int:
+    # The worker half of the Tk app only talks to the window through its
+    # queue, so it runs headless against a stand-in object.
+    import gui
+
+    host = SimpleNamespace(ui_queue=queue.Queue())
+    with timing(gui, "convert_file", samples):
+        gui.ConverterGUI._run_conversion(host, files, [fmt], settings, out, True, workers)
+
+    done = 0
+    while not host.ui_queue.empty():
+        event, status, message = host.ui_queue.get_nowait()
+        if event == "item" and status == "error":
+            raise RuntimeError(message)
+        done += int(event == "item" and status == "ok")
+    return done
+
+
+def run_web(
+    files: List[Path], fmt: str, settings: EncodeSettings, workers: int, out: Path, samples: List[float]
+) -> int:
+    import web_gui
+
+    # Uploads are already in memory by the time a job starts.
+    payloads = [(src.name, src.read_bytes()) for src in files]
+    job_id = secrets.token_urlsafe(10)
+    web_gui.JOBS.create(job_id, total=len(payloads))
+    overrides = {"method": settings.method, "speed": settings.speed, "subsampling": settings.subsampling}
+    with timing(web_gui, "convert_one", samples):
+        web_gui.run_job(job_id, payloads, fmt, settings.quality, workers, overrides=overrides)
+
+    job = web_gui.JOBS.pop(job_id)
+    if job["state"] != "done":
+        raise RuntimeError(job.get("error") or f"job ended in state {job['state']}")
+    shutil.move(job["artifact"], out / "converted_images.zip")
+    return job["completed"]
+
+
+RUNNERS = {"cli": run_cli, "tk": run_tk, "web": run_web}
+
+
+def run_child(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one configuration in this (fresh) process and measure it."""
+    files = [Path(p) for p in config["files"]]
+    workers, encoder_threads = plan_threads(config["workers"], "throughput", formats=[config["format"]])
+    settings = EncodeSettings.from_preset(config["preset"], quality=config["quality"], max_threads=encoder_threads)
+    samples: List[float] = []
+
+    with tempfile.TemporaryDirectory(prefix="bench-out-") as tmp:
+        out = Path(tmp)
+        start = time.perf_counter()
+        done = RUNNERS[config["path"]](files, config["format"], settings, workers, out, samples)
+        elapsed = time.perf_counter() - start
+        output_bytes = sum(p.stat().st_size for p in out.iterdir())
+
+    input_bytes = sum(p.stat().st_size for p in files)
+    rss = peak_rss_bytes()
+    return {
+        "images": done,
+        "elapsed_s": round(elapsed, 4),
+        "images_per_s": round(done / elapsed, 3) if elapsed else None,
+        "input_mb_per_s": round(input_bytes / 1e6 / elapsed, 3) if elapsed else None,
+        "latency_p50_ms": round(percentile(samples, 50) * 1000, 2) if samples else None,
+        "latency_p95_ms": round(percentile(samples, 95) * 1000, 2) if samples else None,
+        "peak_rss_mb": round(rss / 1e6, 1) if rss else None,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+    }
+
+
+def config_key(run: Dict[str, Any]) -> tuple:
+    return run["path"], run["format"], run["quality"], run["preset"], run["workers"]
+
+
+def parse_list(raw: str, cast: Callable[[str], Any] = str) -> List[Any]:
+    return [cast(part.strip()) for part in raw.split(",") if part.strip()]
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Benchmark JPG/JPEG to WebP/AVIF conversion throughput.")
+    parser.add_argument(
+        "--corpus",
+        default=str(Path(tempfile.gettempdir()) / "jpg-to-webp-bench"),
+        help="Corpus directory; generated on first use and reused while --count/--seed match (default: %(default)s).",
+    )
+    parser.add_argument("--count", type=int, default=20, help="Images in the synthetic corpus (default: 20).")
+    parser.add_argument("--seed", type=int, default=1234, help="Corpus random seed (default: 1234).")
+    parser.add_argument("--paths", default=",".join(PATHS), help="Front-end paths to run (default: %(default)s).")
+    parser.add_argument("--formats", default="webp", help="Comma-separated output formats (default: webp).")
+    parser.add_argument("--qualities", default="80", help="Comma-separated qualities (default: 80).")
+    parser.add_argument("--workers", default=f"1,{cpus}", help="Comma-separated worker counts (default: %(default)s).")
+    parser.add_argument(
+        "--preset", choices=list(EFFORT_PRESETS), default="balanced", help="Encoder effort preset (default: balanced)."
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per configuration; the best is kept (default: 1).")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="bench-report.json",
+        help="JSON report to write (default: %(default)s).",
+    )
+    parser.add_argument("--compare", default=None, help="Earlier report to print images/s changes against.")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return 0
+
+    try:
+        paths = parse_list(args.paths)
+        formats = parse_list(args.formats)
+        qualities = parse_list(args.qualities, int)
+        workers = parse_list(args.workers, int)
+        if not set(paths) <= set(PATHS):
+            raise ValueError(f"Paths must be among: {', '.join(PATHS)}.")
+        if not set(formats) <= set(EXTENSIONS):
+            raise ValueError(f"Formats must be among: {', '.join(EXTENSIONS)}.")
+        if not qualities or not workers or min(workers) < 1 or args.count < 1:
+            raise ValueError("Qualities, workers and --count must be positive.")
+    except ValueError as err:
+        print(f"[ERROR] {err}", file=sys.stderr)
+        return 2
+
+    files = load_corpus(Path(args.corpus).expanduser().resolve(), args.count, args.seed)
+    runs = []
+    for path, fmt, quality, count in itertools.product(paths, formats, qualities, workers):
+        config = {
+            "path": path,
+            "format": fmt,
+            "quality": quality,
+            "preset": args.preset,
+            "workers": count,
+            "files": [str(p) for p in files],
+        }
+        best: Dict[str, Any] | None = None
+        for _ in range(max(1, args.repeat)):
+            # A fresh interpreter per run keeps peak RSS and warm caches per configuration.
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", json.dumps(config)],
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                print(f"[ERROR] {path}/{fmt}/q{quality}/w{count}: {proc.stderr.strip()}", file=sys.stderr)
+                break
+            measured = json.loads(proc.stdout.strip().splitlines()[-1])
+            if best is None or measured["elapsed_s"] < best["elapsed_s"]:
+                best = measured
+        if best is None:
+            continue
+
+        config.pop("files")
+        runs.append({**config, **best})
+        print(
+            f"[BENCH] {path:<3} {fmt:<4} q{quality:<3} w{count:<3} "
+            f"{best['images_per_s']:>7.2f} img/s {best['input_mb_per_s']:>7.2f} MB/s "
+            f"p50 {best['latency_p50_ms']} ms p95 {best['latency_p95_ms']} ms rss {best['peak_rss_mb']} MB"
+        )
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": {"count": args.count, "seed": args.seed, "version": CORPUS_VERSION},
+        "runs": runs,
+    }
+    output = Path(args.output).expanduser()
+    with output.open("w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+        fh.write("\n")
+    print(f"Report: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            previous = {config_key(run): run for run in json.load(fh).get("runs", [])}
+        for run in runs:
+            before = previous.get(config_key(run))
+            if before and before.get("images_per_s"):
+                change = run["images_per_s"] / before["images_per_s"] - 1
+                print(f"[COMPARE] {'/'.join(map(str, config_key(run)))}: {change:+.1%} images/s")
+
+    return 0 if len(runs) == len(paths) * len(formats) * len(qualities) * len(workers) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
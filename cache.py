@@ -0,0 +1,168 @@
+"""Persistent content-addressed cache of encoded outputs shared by every front end."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("CONVERTER_CACHE_DIR", "~/.cache/jpg-to-webp")).expanduser()
+DEFAULT_CACHE_BYTES = 2 * 1024**3
+COUNTERS = ("hits", "misses", "writes", "evictions")
+
+# One cache object per directory and size limit in each process, so tasks
+# shipped to pool workers share its connections instead of reopening them.
+_OPEN: Dict[Tuple[Path, int], "OutputCache"] = {}
+_OPEN_LOCK = threading.Lock()
+
+
+def source_digest(raw: bytes | memoryview) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+class OutputCache:
+    """Encoded outputs keyed by source-bytes hash plus encoder settings.
+
+    Blobs live in ``root/<aa>/<key>`` and are published with write + rename,
+    so readers never see partial data. A SQLite index (WAL mode) in the same
+    directory tracks sizes, LRU order and hit/miss/eviction counters, which
+    keeps eviction and statistics consistent across threads and processes.
+    Opening a cache trims it to ``max_bytes``. A pickled cache is restored
+    with :func:`open_cache`, so a worker process opens it once, not per task.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_CACHE_BYTES) -> None:
+        self.root = Path(root).expanduser()
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        with self._db() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            db.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)", [(c,) for c in COUNTERS])
+        # A smaller limit applies now, even to a run that only ever hits.
+        self.trim()
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        # Connections cannot cross process boundaries; workers reuse their own.
+        return open_cache, (self.root, self.max_bytes)
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.root / "index.sqlite", timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def key(digest: str, settings_key: str) -> str:
+        return hashlib.sha256(f"{digest}\0{settings_key}".encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _bump(self, db: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        db.execute("UPDATE counters SET value = value + ? WHERE name = ?", (amount, name))
+
+    def get(self, key: str) -> bytes | None:
+        db = self._db()
+        try:
+            data = self._path(key).read_bytes()
+        except FileNotFoundError:
+            self._bump(db, "misses")
+            return None
+
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._bump(db, "hits")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, len(data), time.time()))
+            self._bump(db, "writes")
+            self._evict(db)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def trim(self) -> None:
+        """Evict least recently used entries until the cache fits ``max_bytes``."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._evict(db)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        (total,) = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in db.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append(key)
+            total -= size
+
+        for key in evicted:
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+        db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in evicted])
+        self._bump(db, "evictions", len(evicted))
+
+    def stats(self) -> Dict[str, int]:
+        db = self._db()
+        out = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        out.update(entries=entries, bytes=size, max_bytes=self.max_bytes)
+        return out
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (
+            f"hits={s['hits']} misses={s['misses']} evictions={s['evictions']} "
+            f"entries={s['entries']} size={s['bytes'] / 1024:,.0f}/{s['max_bytes'] / 1024:,.0f} KB"
+        )
+
+
+def open_cache(root: Path, max_bytes: int = DEFAULT_CACHE_BYTES) -> OutputCache:
+    """This process's :class:`OutputCache` for ``root``, created on first use."""
+    key = (Path(root).expanduser(), max_bytes)
+    with _OPEN_LOCK:
+        cache = _OPEN.get(key)
+        if cache is None:
+            cache = _OPEN[key] = OutputCache(*key)
+        return cache
@@ -4,11 +4,53 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import hashlib
+import itertools
+import json
+import os
+import signal
 import sys
-from pathlib import Path
-from typing import Iterable, List
+import tarfile
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import replace
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Sequence, Set, TextIO, Tuple
+
+from admission import MemoryBudget, estimate_source
+from cache import DEFAULT_CACHE_DIR, OutputCache, open_cache
+from engine import (
+    AVIF_SUBSAMPLING,
+    EFFORT_PRESETS,
+    EXTENSIONS,
+    JPEG_SUFFIXES,
+    THREAD_POLICIES,
+    UNBOUNDED,
+    EncodeSettings,
+    EncoderUnavailableError,
+    Result,
+    Size,
+    convert_bytes,
+    convert_file,
+    convert_ladder,
+    existing_output,
+    expand_formats,
+    parse_max_dimension,
+    parse_size_bytes,
+    parse_ssim,
+    parse_widths,
+    plan_threads,
+)
+from events import EventStream
+from incremental import INDEX_NAME, FingerprintIndex
+from ledger import Ledger
+from profiling import EXPORT_FORMATS, Profiler, profiled
+from scanner import ScanStats, scan
+from tarstream import TarReader, TarWriter
+from watcher import DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE, WATCH_MODES, Watcher
 
-from PIL import Image
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -17,7 +59,7 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "inputs",
         nargs="+",
-        help="One or more files/directories containing JPG/JPEG images.",
+        help="One or more files/directories containing JPG/JPEG images, or - to read one JPEG from stdin.",
     )
     parser.add_argument(
         "-f",
@@ -33,6 +75,53 @@ def parse_args() -> argparse.Namespace:
         default=80,
         help="Quality for output files, 1-100 (default: 80).",
     )
+    parser.add_argument(
+        "--target-size",
+        default=None,
+        help=(
+            "Fit each output under this many bytes, e.g. 150KB, by searching "
+            "quality downwards from -q on one decode (at most 3 extra encodes)."
+        ),
+    )
+    parser.add_argument(
+        "--target-ssim",
+        default=None,
+        help=(
+            "Use the lowest quality (up to -q) whose output still reaches this SSIM "
+            "against the source, e.g. 0.99 (at most 3 extra encodes)."
+        ),
+    )
+    parser.add_argument(
+        "--preset",
+        choices=list(EFFORT_PRESETS),
+        default="balanced",
+        help=(
+            "Encoder effort: 'fastest' for previews, 'balanced' (Pillow defaults), "
+            "or 'smallest' for the final catalog (default: balanced)."
+        ),
+    )
+    parser.add_argument(
+        "--webp-method",
+        type=int,
+        choices=range(0, 7),
+        default=None,
+        metavar="0-6",
+        help="Override the preset's WebP method (0 = fastest, 6 = smallest).",
+    )
+    parser.add_argument(
+        "--avif-speed",
+        type=int,
+        choices=range(0, 11),
+        default=None,
+        metavar="0-10",
+        help="Override the preset's AVIF speed (0 = smallest, 10 = fastest).",
+    )
+    parser.add_argument(
+        "--avif-subsampling",
+        choices=list(AVIF_SUBSAMPLING),
+        default=None,
+        help="Override the preset's AVIF chroma subsampling.",
+    )
     parser.add_argument(
         "-o",
         "--output-dir",
@@ -42,17 +131,232 @@ def parse_args() -> argparse.Namespace:
             "next to source files."
         ),
     )
+    parser.add_argument(
+        "--tar",
+        action="store_true",
+        help=(
+            "Read a tar stream of JPEGs from the input (- for stdin, any compression) and "
+            "write a tar stream of the converted files to stdout, without staging on disk."
+        ),
+    )
     parser.add_argument(
         "-r",
         "--recursive",
         action="store_true",
         help="Scan directories recursively.",
     )
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Only convert files whose path relative to the input folder matches GLOB (repeatable).",
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Skip files and folders whose relative path matches GLOB (repeatable).",
+    )
+    parser.add_argument(
+        "--scan-stats",
+        action="store_true",
+        help="Print directory scan totals and rate (entries/s) at the end of the run.",
+    )
+    parser.add_argument(
+        "--sort",
+        action="store_true",
+        help=(
+            "Scan everything and convert in sorted path order. By default "
+            "conversion starts while directories are still being scanned."
+        ),
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Only convert outputs whose source or encoder settings changed since "
+            "the last run, using a sidecar fingerprint index."
+        ),
+    )
+    parser.add_argument(
+        "--fingerprint",
+        choices=["stat", "hash"],
+        default="stat",
+        help="Source fingerprint for --incremental: size+mtime or SHA-256 of the content (default: stat).",
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help=f"Fingerprint index path for --incremental (default: {INDEX_NAME} in the output directory).",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse encodes from the shared content-addressed output cache.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=str(DEFAULT_CACHE_DIR),
+        help="Output cache directory, shared with the GUIs (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--cache-size",
+        default="2GB",
+        help="Output cache size limit; least recently used entries are evicted (default: 2GB).",
+    )
+    parser.add_argument(
+        "--state-db",
+        default=None,
+        help=(
+            "SQLite work ledger. Records planned/in-flight/done/failed sources so "
+            "a killed run resumes where it stopped; failed sources are retried."
+        ),
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="With --state-db, stop retrying a source after this many failures (default: 3).",
+    )
     parser.add_argument(
         "--overwrite",
         action="store_true",
         help="Overwrite existing output files.",
     )
+    parser.add_argument(
+        "--max-dimension",
+        default="",
+        help=(
+            "Downscale to fit a box, e.g. 1600 or 1600x1200. Large JPEGs are "
+            "reduced while decoding, then resampled (default: keep size)."
+        ),
+    )
+    parser.add_argument(
+        "--sizes",
+        default="",
+        help=(
+            "Comma-separated widths for a responsive ladder, e.g. 320,640,1280. "
+            "Writes <stem>-<width>w.<ext> for every width and format from one decode."
+        ),
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help=(
+            "JSON manifest of ladder outputs for --sizes (default: manifest.json "
+            "in the output directory, or the current directory)."
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of images to convert in parallel, 0 = one per CPU (default: 1).",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help=(
+            "Worker type for --jobs > 1. 'process' runs decode, metadata parsing "
+            "and RGB conversion outside the GIL (default: thread)."
+        ),
+    )
+    parser.add_argument(
+        "--memory-budget",
+        default=None,
+        help=(
+            "Admit parallel jobs only while their estimated peak memory (from "
+            "each JPEG's header) fits this budget, e.g. 6GB (default: unlimited)."
+        ),
+    )
+    parser.add_argument(
+        "--cpu-budget",
+        type=int,
+        default=None,
+        help="CPUs shared by parallel jobs and AVIF encoder threads (default: all).",
+    )
+    parser.add_argument(
+        "--thread-policy",
+        choices=list(THREAD_POLICIES),
+        default="throughput",
+        help=(
+            "How to spend the CPU budget: 'throughput' runs many lightly threaded "
+            "encodes, 'latency' runs few encodes with many AVIF threads each "
+            "(default: throughput)."
+        ),
+    )
+    parser.add_argument(
+        "--events",
+        choices=["text", "jsonl"],
+        default="text",
+        help=(
+            "Output style: human-readable lines, or one JSON object per line on stdout "
+            "(item, progress, error and summary events) for orchestrators (default: text)."
+        ),
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between progress events (throughput and ETA) with --events jsonl (default: 5).",
+    )
+    parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Only print the final summary (errors still go to stderr in text mode).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "Time each stage (read, decode, convert, resize, encode, write) and print "
+            "totals, histograms and worker utilization at the end."
+        ),
+    )
+    parser.add_argument(
+        "--profile-out",
+        default=None,
+        help="Also write the profile to this file (implies --profile).",
+    )
+    parser.add_argument(
+        "--profile-format",
+        choices=list(EXPORT_FORMATS),
+        default="json",
+        help="Format for --profile-out: summary JSON or a Chrome trace of every span (default: json).",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "After converting the inputs, keep running and convert new or changed JPEGs "
+            "in the input folders as they land, on a warm worker pool. Stop with Ctrl-C."
+        ),
+    )
+    parser.add_argument(
+        "--watch-mode",
+        choices=list(WATCH_MODES),
+        default="auto",
+        help=(
+            "How --watch notices changes: inotify (Linux), directory polling, or auto "
+            "(inotify, else polling). Use poll for network shares written by other hosts (default: auto)."
+        ),
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=DEFAULT_SETTLE,
+        help="With --watch, wait until a file's size and mtime are stable this many seconds (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="Seconds between directory checks with --watch-mode poll (default: %(default)s).",
+    )
     return parser.parse_args()
 
 
@@ -61,9 +365,17 @@ def validate_quality(quality: int) -> None:
         raise ValueError("Quality must be between 1 and 100.")
 
 
-def collect_jpeg_files(paths: Iterable[str], recursive: bool) -> List[Path]:
-    out: List[Path] = []
-    suffixes = {".jpg", ".jpeg"}
+def iter_jpeg_files(
+    paths: Iterable[str],
+    recursive: bool,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    stats: ScanStats | None = None,
+) -> Iterator[Path]:
+    """Yield JPG/JPEG files as they are discovered, skipping duplicates."""
+    suffixes = JPEG_SUFFIXES
+    seen: set[Path] = set()
+    stats = stats if stats is not None else ScanStats()
 
     for raw in paths:
         p = Path(raw).expanduser().resolve()
@@ -72,42 +384,263 @@ def collect_jpeg_files(paths: Iterable[str], recursive: bool) -> List[Path]:
             continue
 
         if p.is_file() and p.suffix.lower() in suffixes:
-            out.append(p)
+            candidates: Iterable[Path] = [p]
+        elif p.is_dir():
+            candidates = scan(p, recursive, suffixes, include, exclude, stats)
+        else:
+            print(f"[WARN] Unsupported input (not JPG/JPEG): {p}", file=sys.stderr)
             continue
 
-        if p.is_dir():
-            globber = p.rglob if recursive else p.glob
-            for candidate in globber("*"):
-                if candidate.is_file() and candidate.suffix.lower() in suffixes:
-                    out.append(candidate.resolve())
-            continue
+        for candidate in candidates:
+            if candidate not in seen:
+                seen.add(candidate)
+                yield candidate
+
+
+def collect_jpeg_files(
+    paths: Iterable[str],
+    recursive: bool,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    stats: ScanStats | None = None,
+) -> List[Path]:
+    return sorted(iter_jpeg_files(paths, recursive, include, exclude, stats))
+
+
+Task = Tuple[Path, list]
+
+
+def run_ordered(
+    func: Callable[..., List[Result]],
+    tasks: Iterable[Task],
+    jobs: int,
+    executor: str,
+    budget: MemoryBudget | None = None,
+    cost: Callable[[Path, list], int] | None = None,
+    **kwargs,
+) -> Iterator[Tuple[Path, List[Result]]]:
+    """Yield ``(src, results)`` in task order while up to ``jobs`` tasks run at once.
+
+    With a ``budget``, each task is admitted only once ``cost(src, outputs)``
+    estimated bytes fit alongside the tasks already running.
+    """
+    if jobs <= 1:
+        for src, outputs in tasks:
+            yield src, func(src, outputs, **kwargs) if outputs else []
+        return
+
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    # A bounded window keeps memory flat on huge trees while still letting
+    # fast items run ahead of a slow one at the head of the queue.
+    window = jobs * 4
+    pending: Deque[Tuple[Path, Future]] = deque()
+    pool: Executor = pool_cls(max_workers=jobs)
+    try:
+        for src, outputs in tasks:
+            if outputs:
+                held = budget.acquire(cost(src, outputs)) if budget is not None and cost is not None else 0
+                future = pool.submit(func, src, outputs, **kwargs)
+                if held:
+                    future.add_done_callback(lambda _f, held=held: budget.release(held))
+            else:
+                # Nothing to do (e.g. all outputs current): keep its slot in
+                # the ordered stream without a round trip to a worker.
+                future = Future()
+                future.set_result([])
+            pending.append((src, future))
+            if len(pending) >= window:
+                head_src, head = pending.popleft()
+                yield head_src, head.result()
+
+        while pending:
+            head_src, head = pending.popleft()
+            yield head_src, head.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# How long the watch loop blocks while conversions are running, which bounds
+# the delay between a task finishing and its report.
+WATCH_TICK = 0.1
+WATCH_IDLE_TICK = 1.0
 
-        print(f"[WARN] Unsupported input (not JPG/JPEG): {p}", file=sys.stderr)
 
-    unique = sorted(set(out))
-    return unique
+def run_watch(
+    func: Callable[..., List[Result]],
+    watcher: Watcher,
+    plan: Callable[[List[Path]], Iterable[Task]],
+    jobs: int,
+    executor: str,
+    stop: threading.Event,
+    budget: MemoryBudget | None = None,
+    cost: Callable[[Path, list], int] | None = None,
+    on_idle: Callable[[], None] | None = None,
+    **kwargs,
+) -> Iterator[Tuple[Path, List[Result]]]:
+    """Convert sources as ``watcher`` reports them, yielding ``(src, results)`` as each finishes.
 
+    One pool is started up front and kept for the life of the watch, so a new
+    file goes straight to a warm worker. Once ``stop`` is set, running tasks
+    are drained and the generator returns. ``on_idle`` runs whenever the last
+    running task has been yielded.
 
-def save_image(
-    src: Path,
-    dest: Path,
-    fmt: str,
-    quality: int,
+    A source never has two tasks at once: if it lands again while its task is
+    running, it is held and planned afresh, from whatever is on disk then,
+    once that task has been yielded.
+    """
+    pool: Executor
+    if executor == "process":
+        # Ctrl-C reaches the whole process group; let the parent drain the workers.
+        pool = ProcessPoolExecutor(max_workers=jobs, initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN))
+    else:
+        pool = ThreadPoolExecutor(max_workers=jobs)
+    running: Dict[Future, Path] = {}
+    # Sources that landed again mid-conversion, and those whose turn has come.
+    relanded: Set[Path] = set()
+    released: List[Path] = []
+    try:
+        for future in [pool.submit(os.getpid) for _ in range(jobs)]:
+            future.result()
+
+        while not stop.is_set() or running:
+            if stop.is_set():
+                wait(running, timeout=WATCH_TICK, return_when=FIRST_COMPLETED)
+            else:
+                landed = released + watcher.wait(WATCH_TICK if running or released else WATCH_IDLE_TICK)
+                released = []
+                busy = set(running.values())
+                ready = []
+                for path in dict.fromkeys(landed):
+                    if path in busy:
+                        relanded.add(path)
+                    else:
+                        ready.append(path)
+                for src, outputs in plan(ready):
+                    if not outputs:
+                        yield src, []
+                        continue
+                    held = budget.acquire(cost(src, outputs)) if budget is not None and cost is not None else 0
+                    future = pool.submit(func, src, outputs, **kwargs)
+                    if held:
+                        future.add_done_callback(lambda _f, held=held: budget.release(held))
+                    running[future] = src
+
+            done = [future for future in running if future.done()]
+            for future in done:
+                src = running.pop(future)
+                yield src, future.result()
+                if src in relanded:
+                    relanded.discard(src)
+                    released.append(src)
+            if done and not running and not released and on_idle is not None:
+                on_idle()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def guarded(func: Callable[..., List[Result]], src: Path, outputs: list, **kwargs) -> List[Result]:
+    """Run ``func`` but turn per-source failures into an ``error`` result."""
+    try:
+        return func(src, outputs, **kwargs)
+    except EncoderUnavailableError:
+        raise
+    except Exception as err:
+        return [Result("error", src.name, "", note=f"{type(err).__name__}: {err}")]
+
+
+Pending = Dict[Path, Tuple[Dict[str, Any], List[Result], Dict[Path, str]]]
+
+
+def skip_unchanged(
+    tasks: Iterable[Task],
+    index: FingerprintIndex,
+    output_key: Callable[[tuple], str],
     overwrite: bool,
-) -> bool:
-    if dest.exists() and not overwrite:
-        print(f"[SKIP] Exists: {dest}")
-        return False
+    describe: bool,
+    pending: Pending,
+) -> Iterator[Task]:
+    """Drop outputs whose index entry still matches the source and settings.
+
+    Skipped results and the fingerprint of every source are parked in
+    ``pending`` so they can be merged and recorded once the task completes.
+    """
+    for src, outputs in tasks:
+        fingerprint = index.fingerprint(src)
+        stale = []
+        skipped: List[Result] = []
+        keys: Dict[Path, str] = {}
+        for output in outputs:
+            fmt, dest = output[-2], output[-1]
+            key = output_key(output)
+            if not overwrite and index.is_current(dest, fingerprint, key):
+                if describe:
+                    skipped.append(existing_output(src, fmt, dest, note="Unchanged"))
+                else:
+                    skipped.append(Result("skip", src.name, fmt, dest, note="Unchanged"))
+            else:
+                stale.append(output)
+                keys[dest] = key
+        pending[src] = (fingerprint, skipped, keys)
+        yield src, stale
+
+
+def resolve_jobs(jobs: int, cpus: int) -> int:
+    if jobs < 0:
+        raise ValueError("Jobs must be 0 (auto) or a positive number.")
+    return jobs or cpus
+
+
+def report(result: Result, out: TextIO | None = None) -> None:
+    out = out or sys.stdout
+    if result.status == "error":
+        print(f"[ERROR] {result.src}: {result.note}", file=sys.stderr)
+    elif result.status == "skip":
+        print(f"[SKIP] {result.note or 'Exists'}: {result.dest}", file=out)
+    else:
+        detail = ", ".join(filter(None, [result.note, "cached" if result.cached else ""]))
+        print(f"[OK] {result.src} -> {result.dest}{f' ({detail})' if detail else ''}", file=out)
 
-    dest.parent.mkdir(parents=True, exist_ok=True)
 
-    with Image.open(src) as im:
-        # JPEG never has alpha, but convert to RGB to avoid mode issues.
-        im = im.convert("RGB")
-        im.save(dest, format=fmt.upper(), quality=quality)
+def note(args: argparse.Namespace, message: str, out: TextIO | None = None) -> None:
+    """Print an informational line (stderr by default) unless ``--quiet``; errors and warnings bypass this."""
+    if not args.quiet:
+        print(message, file=out or sys.stderr)
 
-    print(f"[OK] {src.name} -> {dest}")
-    return True
+
+def avif_unavailable(events: EventStream | None) -> int:
+    """Report that no AVIF encoder is installed and return exit code 3."""
+    message = "AVIF encoding is not available. Install pillow-avif-plugin (or a Pillow build with AVIF support)."
+    print(f"[ERROR] {message}", file=sys.stderr)
+    if events is not None:
+        events.error(message)
+        events.summary(3)
+    return 3
+
+
+def write_profile(profiler: Profiler, args: argparse.Namespace, notes: TextIO) -> None:
+    """Print the stage totals and export the trace if ``--profile-out`` asked for one."""
+    profiler.finish()
+    for line in profiler.summary_lines():
+        note(args, f"[PROFILE] {line}")
+    if args.profile_out:
+        profile_path = Path(args.profile_out).expanduser()
+        profiler.export(profile_path, args.profile_format)
+        note(args, f"Profile: {profile_path}", notes)
+
+
+def finish_run(
+    converted: int, failed: int, events: EventStream | None, notes: TextIO, exit_code: int | None = None
+) -> int:
+    """Print (or emit) the closing summary and return the exit code, 4 if any source failed."""
+    if exit_code is None:
+        exit_code = 4 if failed else 0
+    if events is not None:
+        events.summary(exit_code)
+    elif failed:
+        print(f"Done. Converted {converted} file(s), {failed} source(s) failed.", file=notes)
+    else:
+        print(f"Done. Converted {converted} file(s).", file=notes)
+    return exit_code
 
 
 def build_output_path(src: Path, output_dir: Path | None, ext: str) -> Path:
@@ -116,51 +649,487 @@ def build_output_path(src: Path, output_dir: Path | None, ext: str) -> Path:
     return output_dir / f"{src.stem}{ext}"
 
 
+def ladder_output_path(src: Path, output_dir: Path | None, width: int, ext: str) -> Path:
+    return (output_dir or src.parent) / f"{src.stem}-{width}w{ext}"
+
+
+def manifest_entry(src: Path, results: List[Result], base: Path) -> Dict[str, Any]:
+    variants = []
+    for result in results:
+        if result.dimensions is None:
+            continue
+        variants.append(
+            {
+                "path": os.path.relpath(result.dest, base),
+                "format": result.fmt,
+                "width": result.dimensions[0],
+                "height": result.dimensions[1],
+                "bytes": result.nbytes,
+            }
+        )
+    return {"source": str(src), "variants": variants}
+
+
+def write_manifest(path: Path, entries: List[Dict[str, Any]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as fh:
+        json.dump({"images": entries}, fh, indent=2)
+        fh.write("\n")
+
+
+def convert_member(name: PurePosixPath, payload: List[bytes], **kwargs) -> List[Result]:
+    """:func:`run_ordered` task for an in-memory source; ``payload`` holds its JPEG bytes."""
+    return convert_bytes(payload[0], str(name), **kwargs)
+
+
+def convert_stream(
+    args: argparse.Namespace,
+    formats: Sequence[str],
+    settings: EncodeSettings,
+    max_size: Size | None,
+    cache: OutputCache | None,
+    budget: MemoryBudget | None,
+    jobs: int,
+) -> int:
+    """Convert one JPEG from stdin (``-``), or a tar of JPEGs (``--tar``), to stdout.
+
+    Nothing is staged on disk. Tar members are read as the stream reaches
+    them, converted in parallel, and written out in input order; the
+    :func:`run_ordered` window (and ``--memory-budget``) bounds how many are
+    held at once. Notes and events go to stderr so stdout carries only data.
+    """
+    unsupported = [
+        flag
+        for flag, used in (
+            ("--watch", args.watch),
+            ("--sizes", args.sizes),
+            ("--incremental", args.incremental),
+            ("--state-db", args.state_db),
+            ("--output-dir", args.output_dir),
+            ("--sort", args.sort),
+        )
+        if used
+    ]
+    if len(args.inputs) != 1:
+        print("[ERROR] Stream mode takes one input: - for stdin, or a tar file with --tar.", file=sys.stderr)
+        return 2
+    if unsupported:
+        print(f"[ERROR] {', '.join(unsupported)} cannot be combined with stdin/tar streams.", file=sys.stderr)
+        return 2
+    if not args.tar and len(formats) != 1:
+        print("[ERROR] stdout holds one image; choose -f webp or -f avif (or use --tar).", file=sys.stderr)
+        return 2
+    if sys.stdout.isatty():
+        print("[ERROR] Refusing to write image data to a terminal; redirect stdout.", file=sys.stderr)
+        return 2
+
+    events: EventStream | None = None
+    if args.events == "jsonl":
+        events = EventStream(sys.stderr, interval=max(0.1, args.progress_interval), quiet=args.quiet)
+    profiler: Profiler | None = None
+    if args.profile or args.profile_out:
+        profiler = Profiler()
+
+    # A bad member is reported and the rest of the stream still converts.
+    func: Callable[..., List[Result]] = functools.partial(guarded, convert_member)
+    if profiler is not None or events is not None:
+        func = functools.partial(profiled, func)
+
+    def task_cost(_name: PurePosixPath, payload: List[bytes]) -> int:
+        return estimate_source(payload[0], formats, max_size)
+
+    try:
+        source = sys.stdin.buffer if args.inputs[0] == "-" else open(Path(args.inputs[0]).expanduser(), "rb")
+    except OSError as err:
+        print(f"[ERROR] Cannot read input: {err}", file=sys.stderr)
+        return 2
+
+    out = sys.stdout.buffer
+    raw = b""
+    reader: TarReader | None = None
+    writer: TarWriter | None = None
+    converted = 0
+    failed = 0
+    try:
+        try:
+            if args.tar:
+                reader = TarReader(source, args.include, args.exclude)
+                writer = TarWriter(out)
+                tasks: Iterable[Tuple[PurePosixPath, List[bytes]]] = reader
+            else:
+                raw = source.read()
+                tasks = [(PurePosixPath("stdin"), [raw])]
+        except (OSError, tarfile.TarError) as err:
+            print(f"[ERROR] Cannot read input: {err}", file=sys.stderr)
+            return 2
+
+        for name, results in run_ordered(
+            func,
+            tasks,
+            jobs=jobs,
+            executor=args.executor,
+            budget=budget,
+            cost=task_cost,
+            formats=formats,
+            settings=settings,
+            max_size=max_size,
+            cache=cache,
+        ):
+            duration = None
+            if isinstance(results, tuple):
+                results, trace = results
+                duration = trace.end - trace.start
+                if profiler is not None:
+                    profiler.add(trace)
+
+            member = reader.members.popleft() if reader is not None else None
+            # Events and notes name what was written: the member path in the
+            # output tar, or stdout.
+            written: List[Result] = []
+            for result in results:
+                if result.status == "ok":
+                    if writer is not None:
+                        dest = name.with_suffix(EXTENSIONS[result.fmt])
+                        writer.add(dest, result.data, like=member)
+                    else:
+                        dest = PurePosixPath("stdout")
+                        out.write(result.data)
+                    result = replace(result, src=str(name), dest=dest, data=None)
+                written.append(result)
+                if events is None and (not args.quiet or result.status == "error"):
+                    report(result, sys.stderr)
+                converted += int(result.status == "ok")
+                failed += int(result.status == "error")
+            if events is not None:
+                bytes_in = member.size if member is not None else len(raw)
+                events.task(name, written, duration, bytes_in=bytes_in)
+
+        if writer is not None:
+            # Only a complete run gets an end-of-archive marker, so a
+            # consumer can tell a truncated stream from a finished one.
+            writer.close()
+        out.flush()
+    except EncoderUnavailableError:
+        return avif_unavailable(events)
+    except tarfile.TarError as err:
+        print(f"[ERROR] Bad tar stream: {err}", file=sys.stderr)
+        if events is not None:
+            events.error(f"Bad tar stream: {err}")
+            events.summary(2)
+        return 2
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`); silence the flush at exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        print("[ERROR] Output stream closed early.", file=sys.stderr)
+        return 1
+    finally:
+        if reader is not None:
+            reader.close()
+        if source is not sys.stdin.buffer:
+            source.close()
+
+    if profiler is not None:
+        write_profile(profiler, args, sys.stderr)
+
+    if cache is not None:
+        note(args, f"[CACHE] {cache.summary()}")
+    if reader is not None and reader.skipped:
+        note(args, f"[SKIP] {reader.skipped} file(s) in the tar that are not JPEGs or are filtered out")
+
+    exit_code = None
+    if reader is not None and not converted and not failed:
+        print("[ERROR] No JPG/JPEG files found.", file=sys.stderr)
+        exit_code = 1
+    return finish_run(converted, failed, events, sys.stderr, exit_code)
+
+
 def main() -> int:
     args = parse_args()
 
     try:
         validate_quality(args.quality)
+        target_bytes = parse_size_bytes(args.target_size) if args.target_size else None
+        target_ssim = parse_ssim(args.target_ssim) if args.target_ssim else None
+        if target_bytes and target_ssim:
+            raise ValueError("--target-size and --target-ssim cannot be combined.")
+        max_size = parse_max_dimension(args.max_dimension)
+        widths = parse_widths(args.sizes) if args.sizes else []
+        if widths and max_size:
+            raise ValueError("--sizes and --max-dimension cannot be combined.")
+        budget = MemoryBudget(parse_size_bytes(args.memory_budget)) if args.memory_budget else None
+        cache = open_cache(Path(args.cache_dir), parse_size_bytes(args.cache_size)) if args.cache else None
+        cpus = args.cpu_budget or os.cpu_count() or 1
+        if cpus < 1:
+            raise ValueError("CPU budget must be a positive number.")
+        jobs, encoder_threads = plan_threads(
+            resolve_jobs(args.jobs, cpus), args.thread_policy, cpus, expand_formats(args.format)
+        )
     except ValueError as err:
         print(f"[ERROR] {err}", file=sys.stderr)
         return 2
 
-    targets = collect_jpeg_files(args.inputs, recursive=args.recursive)
-    if not targets:
+    formats = expand_formats(args.format)
+
+    settings = EncodeSettings.from_preset(
+        args.preset,
+        quality=args.quality,
+        max_threads=encoder_threads,
+        method=args.webp_method,
+        speed=args.avif_speed,
+        subsampling=args.avif_subsampling,
+        target_bytes=target_bytes,
+        target_ssim=target_ssim,
+    )
+
+    if args.tar or "-" in args.inputs:
+        return convert_stream(args, formats, settings, max_size, cache, budget, jobs)
+
+    scan_stats = ScanStats()
+    scan_options = {
+        "recursive": args.recursive,
+        "include": args.include,
+        "exclude": args.exclude,
+        "stats": scan_stats,
+    }
+    events: EventStream | None = None
+    if args.events == "jsonl":
+        events = EventStream(sys.stdout, interval=max(0.1, args.progress_interval), quiet=args.quiet)
+    # Human-readable notes move to stderr so stdout stays pure JSON lines.
+    notes = sys.stderr if events is not None else sys.stdout
+
+    watcher: Watcher | None = None
+    if args.watch:
+        roots = [p for p in (Path(raw).expanduser().resolve() for raw in args.inputs) if p.is_dir()]
+        if not roots:
+            print("[ERROR] --watch needs at least one input folder.", file=sys.stderr)
+            return 2
+        # Watch before the initial scan so files landing during it are not missed.
+        try:
+            watcher = Watcher(
+                roots,
+                recursive=args.recursive,
+                include=args.include,
+                exclude=args.exclude,
+                mode=args.watch_mode,
+                settle=max(0.0, args.settle),
+                interval=max(0.05, args.poll_interval),
+            )
+        except OSError as err:
+            print(f"[ERROR] Cannot watch inputs: {err}", file=sys.stderr)
+            return 2
+
+    if args.sort:
+        files = collect_jpeg_files(args.inputs, **scan_options)
+        if events is not None:
+            events.total = len(files)
+        discovered: Iterator[Path] = iter(files)
+    else:
+        discovered = iter_jpeg_files(args.inputs, **scan_options)
+
+    first = next(discovered, None)
+    if first is None and watcher is None:
         print("[ERROR] No JPG/JPEG files found.", file=sys.stderr)
         return 1
+    targets = itertools.chain([first], discovered) if first is not None else discovered
 
     output_dir = Path(args.output_dir).expanduser().resolve() if args.output_dir else None
 
-    formats = ["webp", "avif"] if args.format == "both" else [args.format]
+    options: Dict[str, Any] = {"settings": settings, "overwrite": args.overwrite, "cache": cache}
+    if widths:
+        func: Callable[..., List[Result]] = convert_ladder
+        manifest_path = Path(args.manifest or (output_dir or Path.cwd()) / "manifest.json").expanduser()
+    else:
+        func = convert_file
+        options["max_size"] = max_size
 
-    converted = 0
-    for src in targets:
-        for fmt in formats:
-            ext = ".webp" if fmt == "webp" else ".avif"
-            dest = build_output_path(src, output_dir, ext)
-            try:
-                converted += int(
-                    save_image(
-                        src=src,
-                        dest=dest,
-                        fmt=fmt,
-                        quality=args.quality,
-                        overwrite=args.overwrite,
-                    )
+    ledger: Ledger | None = None
+    if args.state_db:
+        ledger = Ledger(Path(args.state_db).expanduser().resolve(), max_attempts=max(1, args.max_attempts))
+    if ledger is not None or watcher is not None:
+        # Keep going past bad sources; the ledger records them for retry and
+        # a watch has to outlive them.
+        func = functools.partial(guarded, func)
+
+    index: FingerprintIndex | None = None
+    pending: Pending = {}
+    if args.incremental:
+        index_path = Path(args.index or (output_dir or Path.cwd()) / INDEX_NAME).expanduser().resolve()
+        index = FingerprintIndex(index_path, use_hash=args.fingerprint == "hash")
+        # Anything that reaches a worker is stale and must be replaced.
+        options["overwrite"] = True
+
+    def output_key(output: tuple) -> str:
+        if widths:
+            width, fmt, _dest = output
+            return settings.key(fmt, width=width)
+        fmt, _dest = output
+        return settings.key(fmt, max_size=max_size)
+
+    def run_signature(outputs: list) -> str:
+        # A ledger row only counts as done for the same outputs and settings.
+        spec = [[str(output[-1]), output_key(output)] for output in outputs]
+        return hashlib.sha256(json.dumps(spec).encode()).hexdigest()
+
+    def plan(sources: Iterable[Path]) -> Iterable[Task]:
+        if widths:
+            tasks: Iterable[Task] = (
+                (
+                    src,
+                    [
+                        (width, fmt, ladder_output_path(src, output_dir, width, EXTENSIONS[fmt]))
+                        for width in widths
+                        for fmt in formats
+                    ],
                 )
-            except (KeyError, OSError):
-                if fmt == "avif":
-                    print(
-                        "[ERROR] AVIF encoding is not available. "
-                        "Install pillow-avif-plugin (or a Pillow build with AVIF support).",
-                        file=sys.stderr,
-                    )
-                    return 3
-                raise
-
-    print(f"Done. Converted {converted} file(s).")
-    return 0
+                for src in sources
+            )
+        else:
+            tasks = (
+                (src, [(fmt, build_output_path(src, output_dir, EXTENSIONS[fmt])) for fmt in formats])
+                for src in sources
+            )
+        if ledger is not None:
+            tasks = ledger.track(tasks, run_signature)
+        if index is not None:
+            tasks = skip_unchanged(tasks, index, output_key, args.overwrite, bool(widths), pending)
+        return tasks
+
+    profiler: Profiler | None = None
+    if args.profile or args.profile_out:
+        profiler = Profiler()
+    if profiler is not None or events is not None:
+        # Outermost wrapper, so spans and task durations come back from
+        # thread and process workers alike.
+        func = functools.partial(profiled, func)
+    tasks = plan(targets)
+    if events is not None:
+        tasks = events.count(tasks)
+
+    def task_cost(src: Path, outputs: list) -> int:
+        fmts = {output[-2] for output in outputs}
+        if widths:
+            return estimate_source(src, fmts, (max(output[0] for output in outputs), UNBOUNDED))
+        return estimate_source(src, fmts, max_size)
+
+    converted = 0
+    failed = 0
+    # Keyed by source, so a watched source converted again replaces its entry.
+    manifest: Dict[Path, Dict[str, Any]] = {}
+
+    def finish(src: Path, results: Any) -> None:
+        nonlocal converted, failed
+        # Tasks with nothing left to do never reach a worker and carry no trace.
+        duration = None
+        if isinstance(results, tuple):
+            results, trace = results
+            duration = trace.end - trace.start
+            if profiler is not None:
+                profiler.add(trace)
+
+        if index is not None:
+            fingerprint, skipped, keys = pending.pop(src)
+            for result in results:
+                if result.status == "ok":
+                    index.record(result.dest, src, fingerprint, keys[result.dest])
+            results = skipped + results
+
+        if ledger is not None:
+            ledger.finish(src, results)
+
+        if events is not None:
+            events.task(src, results, duration)
+        for result in results:
+            if events is None and (not args.quiet or result.status == "error"):
+                report(result)
+            converted += int(result.status == "ok")
+            failed += int(result.status == "error")
+        if widths:
+            manifest[src] = manifest_entry(src, results, manifest_path.resolve().parent)
+
+    try:
+        for src, results in run_ordered(
+            func, tasks, jobs=jobs, executor=args.executor, budget=budget, cost=task_cost, **options
+        ):
+            finish(src, results)
+
+        if watcher is not None:
+            stop = threading.Event()
+
+            def request_stop(signum: int, _frame: Any) -> None:
+                stop.set()
+                # A second Ctrl-C skips draining and exits straight away.
+                signal.signal(signum, signal.SIG_DFL)
+
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, request_stop)
+
+            def sync() -> None:
+                if index is not None:
+                    index.save()
+                if ledger is not None:
+                    ledger.commit()
+
+            def changed(sources: List[Path]) -> Iterable[Task]:
+                # A source that changed on disk is new work, whatever the ledger says.
+                if ledger is not None:
+                    for src in sources:
+                        ledger.reset(src)
+                return plan(sources)
+
+            sync()
+            if events is not None:
+                events.total = None
+            note(
+                args,
+                f"[WATCH] Watching {watcher.watched_dirs} folder(s) with {watcher.mode}, "
+                f"settle {watcher.settle:g}s; Ctrl-C to stop",
+            )
+            # Outputs of a changed source are stale even though they exist.
+            for src, results in run_watch(
+                func,
+                watcher,
+                changed,
+                jobs=jobs,
+                executor=args.executor,
+                stop=stop,
+                budget=budget,
+                cost=task_cost,
+                on_idle=sync,
+                **{**options, "overwrite": True},
+            ):
+                finish(src, results)
+                if events is not None:
+                    events.flush()
+                else:
+                    sys.stdout.flush()
+    except EncoderUnavailableError:
+        return avif_unavailable(events)
+    finally:
+        if watcher is not None:
+            watcher.close()
+        if index is not None:
+            index.save()
+        if ledger is not None:
+            note(args, f"[STATE] {ledger.summary()}")
+            ledger.close()
+
+    if profiler is not None:
+        write_profile(profiler, args, notes)
+
+    if args.scan_stats:
+        note(args, f"[SCAN] {scan_stats.summary()}")
+
+    if cache is not None:
+        note(args, f"[CACHE] {cache.summary()}")
+
+    if widths:
+        write_manifest(manifest_path, list(manifest.values()))
+        note(args, f"Manifest: {manifest_path}", notes)
+
+    if ledger is not None:
+        # Sources that used up their retries are still failures of this batch.
+        failed += ledger.exhausted
+    return finish_run(converted, failed, events, notes)
 
 
 if __name__ == "__main__":
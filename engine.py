@@ -0,0 +1,596 @@
+"""Shared decode-once, encode-many conversion engine for every front end."""
+
+from __future__ import annotations
+
+import io
+import json
+import math
+import os
+import threading
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import BinaryIO, List, Sequence, Tuple, Union
+
+from PIL import Image
+
+import profiling
+from cache import OutputCache, source_digest
+from metrics import luma_plane, ssim
+
+JPEG_SUFFIXES = {".jpg", ".jpeg"}
+EXTENSIONS = {"webp": ".webp", "avif": ".avif"}
+THREAD_POLICIES = ("throughput", "latency")
+# Fit-box height used when only a width limit matters.
+UNBOUNDED = 1 << 30
+
+# libavif stops scaling much past this many threads for a single image.
+LATENCY_ENCODER_THREADS = 8
+
+AVIF_SUBSAMPLING = ("4:2:0", "4:2:2", "4:4:4")
+# Effort presets. Figures are single-core images/s and output bytes relative
+# to "balanced" at quality 80, measured on a synthetic 24-image 1600x1067
+# corpus with Pillow 12.3 (full table in README).
+EFFORT_PRESETS: dict[str, dict[str, object]] = {
+    # WebP 33 img/s (4.9x), 1.13x bytes; AVIF 12.5 img/s (7.1x), 1.01x bytes.
+    "fastest": {"method": 0, "speed": 10, "subsampling": "4:2:0"},
+    # Pillow's defaults. WebP 6.8 img/s; AVIF 1.4-1.8 img/s.
+    "balanced": {"method": 4, "speed": 6, "subsampling": "4:2:0"},
+    # WebP 4.7 img/s (0.70x), 0.98x bytes; AVIF 0.17 img/s (0.12x), 0.94x bytes.
+    # AVIF speed 2 saved only 0.5% more at a quarter of this speed.
+    "smallest": {"method": 6, "speed": 4, "subsampling": "4:2:0"},
+}
+
+# Target modes (bytes or SSIM): encodes allowed beyond the first one at the
+# requested quality, the lowest quality tried, and the starting guess for how
+# many quality points halve the output (refined from real encodes).
+TARGET_EXTRA_ENCODES = 3
+TARGET_MIN_QUALITY = 5
+TARGET_HALVING_QUALITY = 20
+# SSIM mode prior: the distance 1 - SSIM grows roughly as (101 - quality) ** k.
+SSIM_DISTANCE_EXPONENT = 0.7
+
+Source = Union[Path, str, bytes, bytearray, memoryview]
+Size = Tuple[int, int]
+
+
+class EncoderUnavailableError(RuntimeError):
+    """Raised when Pillow has no encoder for the requested output format."""
+
+    def __init__(self, fmt: str) -> None:
+        super().__init__(f"{fmt.upper()} encoding is not available.")
+        self.fmt = fmt
+
+    def __reduce__(self):
+        # Keep the exception intact when it crosses a process-pool boundary.
+        return (type(self), (self.fmt,))
+
+
+@dataclass(frozen=True)
+class EncodeSettings:
+    quality: int = 80
+    # AVIF encoder threads; None keeps Pillow's default of one per CPU.
+    max_threads: int | None = None
+    # Effort knobs; None keeps Pillow's defaults (see EFFORT_PRESETS).
+    method: int | None = None
+    speed: int | None = None
+    subsampling: str | None = None
+    # Target modes: output bytes to fit, or the lowest SSIM to accept.
+    # ``quality`` becomes the ceiling of the search.
+    target_bytes: int | None = None
+    target_ssim: float | None = None
+
+    @classmethod
+    def from_preset(cls, preset: str = "balanced", **overrides: object) -> "EncodeSettings":
+        """Build settings from a named effort preset; ``None`` overrides are ignored."""
+        if preset not in EFFORT_PRESETS:
+            raise ValueError(f"Unknown preset: {preset}")
+        params = dict(EFFORT_PRESETS[preset])
+        params.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**params)
+
+    def save_params(self, fmt: str) -> dict:
+        params: dict = {"quality": self.quality}
+        if fmt == "webp" and self.method is not None:
+            params["method"] = self.method
+        if fmt == "avif":
+            if self.max_threads:
+                params["max_threads"] = self.max_threads
+            if self.speed is not None:
+                params["speed"] = self.speed
+            if self.subsampling is not None:
+                params["subsampling"] = self.subsampling
+        return params
+
+    def key(self, fmt: str, **extra: object) -> str:
+        """Stable string of everything that changes the encoded bytes for ``fmt``."""
+        params = self.save_params(fmt)
+        # Thread count changes speed, not output.
+        params.pop("max_threads", None)
+        if self.target_bytes is not None:
+            params["target_bytes"] = self.target_bytes
+        if self.target_ssim is not None:
+            params["target_ssim"] = self.target_ssim
+        return json.dumps({"format": fmt, **params, **extra}, sort_keys=True)
+
+
+@dataclass(frozen=True)
+class Result:
+    status: str
+    src: str
+    fmt: str
+    dest: Path | None = None
+    data: bytes | None = None
+    dimensions: Size | None = None
+    nbytes: int | None = None
+    note: str = ""
+    cached: bool = False
+
+
+def has_avif_encoder() -> bool:
+    try:
+        buf = io.BytesIO()
+        Image.new("RGB", (1, 1), color=(0, 0, 0)).save(buf, format="AVIF")
+        return True
+    except Exception:
+        return False
+
+
+def plan_threads(
+    workers: int, policy: str = "throughput", cpus: int | None = None, formats: Sequence[str] = ("webp", "avif")
+) -> tuple[int, int]:
+    """Split a CPU budget into ``(pool_size, encoder_threads)``.
+
+    ``throughput`` runs as many single- or few-threaded encodes as the budget
+    allows; ``latency`` runs fewer encodes that each use many AVIF threads.
+    ``pool_size * encoder_threads`` never exceeds ``cpus``. Only AVIF encodes
+    are threaded, so without ``"avif"`` in ``formats`` the policy does not
+    apply and the pool is sized from ``cpus`` alone.
+    """
+    if policy not in THREAD_POLICIES:
+        raise ValueError(f"Unknown thread policy: {policy}")
+
+    cpus = max(1, cpus or os.cpu_count() or 1)
+    workers = max(1, workers)
+
+    if "avif" not in formats:
+        return min(workers, cpus), 1
+    if policy == "latency":
+        encoder_threads = min(cpus, LATENCY_ENCODER_THREADS)
+        pool_size = max(1, min(workers, cpus // encoder_threads))
+    else:
+        pool_size = min(workers, cpus)
+        encoder_threads = max(1, cpus // pool_size)
+    return pool_size, encoder_threads
+
+
+def expand_formats(choice: str) -> List[str]:
+    return ["webp", "avif"] if choice == "both" else [choice]
+
+
+def output_name(stem: str, fmt: str) -> str:
+    return f"{stem}{EXTENSIONS[fmt]}"
+
+
+def parse_max_dimension(raw: str) -> Size | None:
+    """Parse ``"1600"`` (square box) or ``"1600x1200"``; an empty string means no limit."""
+    raw = raw.strip().lower()
+    if not raw:
+        return None
+    try:
+        parts = [int(p) for p in raw.split("x")]
+    except ValueError:
+        raise ValueError("Max dimension must look like 1600 or 1600x1200.") from None
+    if len(parts) == 1:
+        parts *= 2
+    if len(parts) != 2 or min(parts) < 1:
+        raise ValueError("Max dimension must look like 1600 or 1600x1200.")
+    return parts[0], parts[1]
+
+
+def parse_size_bytes(raw: str) -> int:
+    """Parse sizes such as ``"150KB"``, ``"2GB"`` or ``"4096"`` (bytes)."""
+    text = raw.strip().upper().replace(" ", "")
+    units = {"TB": 1024**4, "GB": 1024**3, "MB": 1024**2, "KB": 1024, "K": 1024, "M": 1024**2, "G": 1024**3, "B": 1}
+    for suffix, factor in units.items():
+        if text.endswith(suffix):
+            text, scale = text[: -len(suffix)], factor
+            break
+    else:
+        scale = 1
+    try:
+        value = float(text)
+    except ValueError:
+        raise ValueError(f"Invalid size: {raw!r} (use e.g. 150KB or 2GB).") from None
+    if value <= 0:
+        raise ValueError(f"Invalid size: {raw!r} (must be positive).")
+    return int(value * scale)
+
+
+def parse_ssim(raw: str) -> float:
+    """Parse an SSIM target such as ``"0.99"``; it must lie strictly between 0 and 1."""
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ValueError(f"Invalid SSIM target: {raw!r} (use e.g. 0.99).") from None
+    if not 0 < value < 1:
+        raise ValueError("SSIM target must be between 0 and 1, e.g. 0.99.")
+    return value
+
+
+def parse_widths(raw: str) -> List[int]:
+    """Parse a comma-separated width list such as ``"320,640,1280"``."""
+    try:
+        widths = sorted({int(p) for p in raw.split(",") if p.strip()})
+    except ValueError:
+        raise ValueError("Sizes must be comma-separated widths, e.g. 320,640,1280.") from None
+    if not widths or widths[0] < 1:
+        raise ValueError("Sizes must be comma-separated widths, e.g. 320,640,1280.")
+    return widths
+
+
+def fit_size(size: Size, box: Size) -> Size:
+    """Largest size with ``size``'s aspect ratio that fits in ``box``; never upscales."""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def decode(source: Source, max_size: Size | None = None) -> Image.Image:
+    if not isinstance(source, (bytes, bytearray, memoryview)) and profiling.enabled():
+        # Read up front when profiling so file I/O is not counted as decode.
+        source = _read(Path(source))
+
+    with profiling.stage("decode"):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            im = Image.open(io.BytesIO(source))
+        else:
+            im = Image.open(source)
+
+        target = fit_size(im.size, max_size) if max_size else im.size
+        if target != im.size:
+            # Let libjpeg scale by 1/2, 1/4 or 1/8 in the DCT domain while
+            # decoding; draft never goes below the requested size.
+            im.draft("RGB", target)
+        im.load()
+
+    # JPEG never has alpha, but convert to RGB to avoid mode issues. RGB
+    # sources are used as-is so the decoded buffer is not copied.
+    if im.mode != "RGB":
+        with profiling.stage("convert"):
+            im = im.convert("RGB")
+    if im.size != target:
+        with profiling.stage("resize"):
+            im = im.resize(target, Image.Resampling.LANCZOS)
+    return im
+
+
+def _read(src: Path) -> bytes:
+    with profiling.stage("read"):
+        return src.read_bytes()
+
+
+def encode(im: Image.Image, fmt: str, settings: EncodeSettings, out: Path | BinaryIO) -> None:
+    try:
+        with profiling.stage("encode"):
+            im.save(out, format=fmt.upper(), **settings.save_params(fmt))
+    except (KeyError, OSError) as err:
+        if fmt == "avif":
+            raise EncoderUnavailableError(fmt) from err
+        raise
+
+
+def encode_bytes(im: Image.Image, fmt: str, settings: EncodeSettings) -> bytes:
+    out = io.BytesIO()
+    encode(im, fmt, settings, out)
+    return out.getvalue()
+
+
+def _interpolate(points: dict[float, float], goal: float, default_slope: float) -> float:
+    """Position at which a log-scale metric (``points``: position -> value) should reach ``goal``.
+
+    Interpolates between the nearest tried qualities on either side of the
+    goal, or extrapolates from the nearest ones when only one side is known.
+    """
+    below = [q for q, v in points.items() if v <= goal]
+    above = [q for q, v in points.items() if v > goal]
+    if below and above:
+        a = min(below, key=lambda q: goal - points[q])
+        b = min(above, key=lambda q: points[q] - goal)
+    else:
+        nearest = sorted(points, key=lambda q: abs(points[q] - goal))
+        a, b = nearest[0], nearest[min(1, len(nearest) - 1)]
+
+    slope = default_slope
+    if a != b:
+        measured = (points[b] - points[a]) / (b - a)
+        # Encoder noise can flip the trend over small steps; keep the prior then.
+        if measured * default_slope > 0:
+            slope = measured
+    return a + (goal - points[a]) / slope
+
+
+def _next_quality(guess: float, low: int, high: int, floor: int, ceiling: int) -> int:
+    """Round ``guess`` into the open bracket ``(low, high)``.
+
+    Once both ends are real encodes, the guess is also kept in the middle
+    half of the bracket: on flat stretches of the curve plain interpolation
+    creeps in from one side and would spend the whole encode budget there.
+    """
+    if floor < low and high < ceiling:
+        quarter = (high - low) / 4
+        guess = min(max(guess, low + quarter), high - quarter)
+    return min(max(round(guess), low + 1), high - 1)
+
+
+def encode_to_target(
+    im: Image.Image, fmt: str, settings: EncodeSettings, extra_encodes: int = TARGET_EXTRA_ENCODES
+) -> tuple[bytes, int]:
+    """Return ``(data, quality)`` for the highest quality that fits ``settings.target_bytes``.
+
+    Starts at ``settings.quality`` and spends at most ``extra_encodes`` more
+    encodes searching downwards; every candidate stays in memory, so the
+    winner is never encoded twice. When nothing tried fits, the smallest
+    candidate is returned.
+    """
+    target = settings.target_bytes
+    if target is None:
+        return encode_bytes(im, fmt, settings), settings.quality
+
+    candidates: dict[int, bytes] = {}
+    # Highest quality known to fit and lowest known to overshoot.
+    floor, ceiling = min(TARGET_MIN_QUALITY, settings.quality) - 1, settings.quality + 1
+    low, high = floor, ceiling
+    quality = settings.quality
+    for _ in range(1 + max(0, extra_encodes)):
+        candidates[quality] = encode_bytes(im, fmt, replace(settings, quality=quality, target_bytes=None))
+        if len(candidates[quality]) <= target:
+            low = quality
+        else:
+            high = quality
+        if high - low <= 1:
+            break
+        points = {q: math.log(len(data)) for q, data in candidates.items()}
+        guess = _interpolate(points, math.log(target), math.log(2) / TARGET_HALVING_QUALITY)
+        quality = _next_quality(guess - 0.5, low, high, floor, ceiling)
+
+    fits = [q for q, data in candidates.items() if len(data) <= target]
+    best = max(fits) if fits else min(candidates, key=lambda q: len(candidates[q]))
+    return candidates[best], best
+
+
+def encode_to_ssim(
+    im: Image.Image, fmt: str, settings: EncodeSettings, extra_encodes: int = TARGET_EXTRA_ENCODES
+) -> tuple[bytes, int, float]:
+    """Return ``(data, quality, score)`` for the lowest quality whose SSIM meets ``settings.target_ssim``.
+
+    Each candidate is decoded and scored against ``im`` on its luma plane,
+    at full size up to :data:`metrics.SSIM_SIDE` (see :mod:`metrics`). The search starts at ``settings.quality``,
+    which is also the result when even that quality misses the target.
+    """
+    target = settings.target_ssim
+    if target is None:
+        raise ValueError("encode_to_ssim needs settings.target_ssim.")
+
+    with profiling.stage("score"):
+        reference = luma_plane(im)
+    candidates: dict[int, tuple[bytes, float]] = {}
+    # Highest quality known to miss the target and lowest known to meet it.
+    floor, ceiling = min(TARGET_MIN_QUALITY, settings.quality) - 1, settings.quality + 1
+    low, high = floor, ceiling
+    quality = settings.quality
+    for _ in range(1 + max(0, extra_encodes)):
+        data = encode_bytes(im, fmt, replace(settings, quality=quality, target_ssim=None))
+        with profiling.stage("score"), Image.open(io.BytesIO(data)) as decoded:
+            score = ssim(reference, luma_plane(decoded))
+        candidates[quality] = (data, score)
+        if score >= target:
+            high = quality
+        else:
+            low = quality
+        if high - low <= 1:
+            break
+        points = {math.log(101 - q): math.log(max(1.0 - sc, 1e-9)) for q, (_data, sc) in candidates.items()}
+        guess = 101 - math.exp(_interpolate(points, math.log(1.0 - target), SSIM_DISTANCE_EXPONENT))
+        quality = _next_quality(guess + 0.5, low, high, floor, ceiling)
+
+    passing = [q for q, (_data, sc) in candidates.items() if sc >= target]
+    best = min(passing) if passing else max(candidates)
+    data, score = candidates[best]
+    return data, best, score
+
+
+def _encode_data(im: Image.Image, fmt: str, settings: EncodeSettings) -> tuple[bytes, str]:
+    """Encode in memory; in target modes the note records the chosen quality (and score)."""
+    if settings.target_ssim is not None:
+        data, quality, score = encode_to_ssim(im, fmt, settings)
+        miss = ", below target" if score < settings.target_ssim else ""
+        return data, f"q={quality}, ssim={score:.4f}{miss}"
+    if settings.target_bytes is not None:
+        data, quality = encode_to_target(im, fmt, settings)
+        miss = ", over target" if len(data) > settings.target_bytes else ""
+        return data, f"q={quality}{miss}"
+    return encode_bytes(im, fmt, settings), ""
+
+
+def _cache_lookup(cache: OutputCache | None, digest: str, key: str) -> bytes | None:
+    return cache.get(OutputCache.key(digest, key)) if cache is not None else None
+
+
+def _temp_path(dest: Path) -> Path:
+    return dest.with_name(f".{dest.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def _write(dest: Path, data: bytes) -> None:
+    # Write next to the destination and rename into place, so an interrupted
+    # run never leaves a truncated file that looks complete.
+    with profiling.stage("write"):
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = _temp_path(dest)
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, dest)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+
+def convert_file(
+    src: Path,
+    outputs: Sequence[tuple[str, Path]],
+    settings: EncodeSettings,
+    overwrite: bool,
+    max_size: Size | None = None,
+    cache: OutputCache | None = None,
+) -> List[Result]:
+    """Decode ``src`` at most once and write every ``(fmt, dest)`` output.
+
+    With a ``cache``, the source is read once into memory, hashed, and each
+    output is served from the cache when an identical encode already exists.
+    """
+    results: List[Result] = []
+    im: Image.Image | None = None
+    raw: bytes | None = None
+    digest = ""
+
+    for fmt, dest in outputs:
+        if dest.exists() and not overwrite:
+            results.append(Result("skip", src.name, fmt, dest))
+            continue
+
+        if cache is None:
+            if im is None:
+                im = decode(src, max_size)
+            data, note = _encode_data(im, fmt, settings)
+            _write(dest, data)
+            results.append(Result("ok", src.name, fmt, dest, dimensions=im.size, nbytes=len(data), note=note))
+            continue
+
+        if raw is None:
+            raw = _read(src)
+            digest = source_digest(raw)
+        key = settings.key(fmt, max_size=max_size)
+        data = _cache_lookup(cache, digest, key)
+        cached = data is not None
+        note = ""
+        if data is None:
+            if im is None:
+                im = decode(raw, max_size)
+            data, note = _encode_data(im, fmt, settings)
+            cache.put(OutputCache.key(digest, key), data)
+        _write(dest, data)
+        results.append(
+            Result(
+                "ok",
+                src.name,
+                fmt,
+                dest,
+                dimensions=im.size if im is not None else None,
+                nbytes=len(data),
+                note=note,
+                cached=cached,
+            )
+        )
+
+    return results
+
+
+def existing_output(src: Path, fmt: str, dest: Path, note: str = "") -> Result:
+    # Only the header is parsed, so this stays cheap for manifests of skipped outputs.
+    with Image.open(dest) as im:
+        dimensions = im.size
+    return Result("skip", src.name, fmt, dest, dimensions=dimensions, nbytes=dest.stat().st_size, note=note)
+
+
+def convert_ladder(
+    src: Path,
+    outputs: Sequence[tuple[int, str, Path]],
+    settings: EncodeSettings,
+    overwrite: bool,
+    cache: OutputCache | None = None,
+) -> List[Result]:
+    """Write every ``(width, fmt, dest)`` variant of ``src`` from a single decode.
+
+    The decode is drafted down to the widest pending width, and each narrower
+    level is resampled from the previous one. Widths wider than the source
+    are skipped rather than upscaled. Cached variants are written without
+    decoding at all.
+    """
+    results: dict[int, Result] = {}
+    pending: dict[int, list[tuple[int, str, Path]]] = {}
+    source: Source = src
+    digest = ""
+    if cache is not None:
+        source = _read(src)
+        digest = source_digest(source)
+
+    for index, (width, fmt, dest) in enumerate(outputs):
+        if dest.exists() and not overwrite:
+            results[index] = existing_output(src, fmt, dest)
+            continue
+
+        data = _cache_lookup(cache, digest, settings.key(fmt, width=width))
+        if data is not None:
+            _write(dest, data)
+            with Image.open(io.BytesIO(data)) as im:
+                dimensions = im.size
+            results[index] = Result(
+                "ok", src.name, fmt, dest, dimensions=dimensions, nbytes=len(data), cached=True
+            )
+        else:
+            pending.setdefault(width, []).append((index, fmt, dest))
+
+    if pending:
+        level = decode(source, (max(pending), UNBOUNDED))
+        for width in sorted(pending, reverse=True):
+            if width > level.width:
+                for index, fmt, dest in pending[width]:
+                    results[index] = Result("skip", src.name, fmt, dest, note=f"Source narrower than {width}px")
+                continue
+
+            if width < level.width:
+                with profiling.stage("resize"):
+                    level = level.resize(fit_size(level.size, (width, UNBOUNDED)), Image.Resampling.LANCZOS)
+            for index, fmt, dest in pending[width]:
+                data, note = _encode_data(level, fmt, settings)
+                if cache is not None:
+                    cache.put(OutputCache.key(digest, settings.key(fmt, width=width)), data)
+                _write(dest, data)
+                results[index] = Result(
+                    "ok", src.name, fmt, dest, dimensions=level.size, nbytes=len(data), note=note
+                )
+
+    return [results[index] for index in range(len(outputs))]
+
+
+def convert_bytes(
+    raw: Source,
+    filename: str,
+    formats: Sequence[str],
+    settings: EncodeSettings,
+    max_size: Size | None = None,
+    cache: OutputCache | None = None,
+) -> List[Result]:
+    """Decode an in-memory JPEG at most once and encode it to every format in ``formats``."""
+    stem = Path(filename).stem
+    digest = source_digest(raw) if cache is not None else ""
+    im: Image.Image | None = None
+    results: List[Result] = []
+
+    for fmt in formats:
+        key = settings.key(fmt, max_size=max_size)
+        data = _cache_lookup(cache, digest, key)
+        cached = data is not None
+        note = ""
+        if data is None:
+            if im is None:
+                im = decode(raw, max_size)
+            data, note = _encode_data(im, fmt, settings)
+            if cache is not None:
+                cache.put(OutputCache.key(digest, key), data)
+        results.append(
+            Result(
+                "ok", filename, fmt, Path(output_name(stem, fmt)), data, nbytes=len(data), note=note, cached=cached
+            )
+        )
+
+    return results
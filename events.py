@@ -0,0 +1,131 @@
+"""Buffered JSON-lines event stream for orchestrators driving the CLI."""
+
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path, PurePath
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, TypeVar
+
+from engine import Result
+
+# Flush once this many characters are buffered, or at every progress event.
+FLUSH_CHARS = 64 * 1024
+
+T = TypeVar("T")
+
+
+class EventStream:
+    """Writes one JSON object per line: ``item``, ``progress``, ``error`` and ``summary`` events.
+
+    Lines are buffered and written in blocks, so millions of items cost a few
+    thousand writes. ``progress`` events (throughput and, once the number of
+    sources is known, an ETA) are emitted at most every ``interval`` seconds.
+    With ``quiet``, only the ``summary`` (and ``error``) events are written.
+    """
+
+    def __init__(self, stream: TextIO, interval: float = 5.0, quiet: bool = False) -> None:
+        self.stream = stream
+        self.interval = interval
+        self.quiet = quiet
+        self.started = time.monotonic()
+        self._next_progress = self.started + interval
+        self._buffer: List[str] = []
+        self._buffered = 0
+
+        self.total: int | None = None
+        self.sources = 0
+        self.counts = {"ok": 0, "skip": 0, "error": 0}
+        self.cached = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def emit(self, event: str, **fields: Any) -> None:
+        line = json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, separators=(",", ":"))
+        self._buffer.append(line)
+        self._buffered += len(line) + 1
+        if self._buffered >= FLUSH_CHARS:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            self.stream.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+            self._buffered = 0
+        self.stream.flush()
+
+    def count(self, items: Iterable[T]) -> Iterator[T]:
+        """Pass ``items`` through, fixing :attr:`total` once they are exhausted."""
+        seen = 0
+        for item in items:
+            seen += 1
+            yield item
+        self.total = seen
+
+    def task(self, src: PurePath, results: List[Result], duration: float | None, bytes_in: int | None = None) -> None:
+        """Record one finished source; ``bytes_in`` is taken from the file when not given."""
+        if bytes_in is None and isinstance(src, Path):
+            try:
+                bytes_in = src.stat().st_size
+            except OSError:
+                pass
+
+        self.sources += 1
+        self.bytes_in += bytes_in or 0
+        for result in results:
+            self.counts[result.status] = self.counts.get(result.status, 0) + 1
+            self.cached += int(result.cached)
+            if result.status == "ok":
+                self.bytes_out += result.nbytes or 0
+            if not self.quiet:
+                self.emit(
+                    "item",
+                    status=result.status,
+                    source=str(src),
+                    dest=str(result.dest) if result.dest is not None else None,
+                    format=result.fmt or None,
+                    bytes_in=bytes_in,
+                    bytes_out=result.nbytes,
+                    duration_s=round(duration, 4) if duration is not None else None,
+                    cached=result.cached,
+                    note=result.note or None,
+                )
+
+        now = time.monotonic()
+        if now >= self._next_progress:
+            self._next_progress = now + self.interval
+            if not self.quiet:
+                self.emit("progress", **self._rates(now))
+            self.flush()
+
+    def _rates(self, now: float) -> Dict[str, Any]:
+        elapsed = now - self.started
+        rate = self.sources / elapsed if elapsed else 0.0
+        eta = None
+        if self.total is not None and rate:
+            eta = round(max(self.total - self.sources, 0) / rate, 1)
+        return {
+            "sources": self.sources,
+            "total": self.total,
+            "converted": self.counts["ok"],
+            "skipped": self.counts["skip"],
+            "failed": self.counts["error"],
+            "elapsed_s": round(elapsed, 3),
+            "sources_per_s": round(rate, 3),
+            "mb_in_per_s": round(self.bytes_in / 1e6 / elapsed, 3) if elapsed else 0.0,
+            "eta_s": eta,
+        }
+
+    def error(self, message: str) -> None:
+        self.emit("error", message=message)
+
+    def summary(self, exit_code: int) -> None:
+        self.emit(
+            "summary",
+            exit_code=exit_code,
+            cached=self.cached,
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out,
+            **self._rates(time.monotonic()),
+        )
+        self.flush()
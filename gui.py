@@ -3,25 +3,36 @@
 
 from __future__ import annotations
 
-import io
+import functools
 import os
 import queue
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
-from PIL import Image
-
-
-def has_avif_encoder() -> bool:
-    try:
-        buf = io.BytesIO()
-        Image.new("RGB", (1, 1), color=(0, 0, 0)).save(buf, format="AVIF")
-        return True
-    except Exception:
-        return False
+from admission import MemoryBudget, estimate_source
+from cache import DEFAULT_CACHE_DIR, OutputCache, open_cache
+from engine import (
+    AVIF_SUBSAMPLING,
+    EFFORT_PRESETS,
+    EXTENSIONS,
+    JPEG_SUFFIXES,
+    THREAD_POLICIES,
+    EncodeSettings,
+    convert_file,
+    expand_formats,
+    has_avif_encoder,
+    parse_max_dimension,
+    parse_size_bytes,
+    plan_threads,
+)
+from profiling import Profiler
+from scanner import scan
+
+# Subsampling combobox entry that keeps the preset's own setting.
+PRESET_SUBSAMPLING = "preset"
 
 
 class ConverterGUI(tk.Tk):
@@ -46,8 +57,17 @@ class ConverterGUI(tk.Tk):
         self.quality_var = tk.IntVar(value=80)
         self.recursive_var = tk.BooleanVar(value=True)
         self.overwrite_var = tk.BooleanVar(value=False)
+        self.cache_var = tk.BooleanVar(value=False)
+        self.profile_var = tk.BooleanVar(value=False)
+        self.memory_budget_var = tk.StringVar(value="")
+        self.preset_var = tk.StringVar(value="balanced")
+        self.webp_method_var = tk.StringVar(value="")
+        self.avif_speed_var = tk.StringVar(value="")
+        self.avif_subsampling_var = tk.StringVar(value=PRESET_SUBSAMPLING)
         self.output_dir_var = tk.StringVar(value="")
         self.workers_var = tk.IntVar(value=default_workers)
+        self.policy_var = tk.StringVar(value="throughput")
+        self.max_dimension_var = tk.StringVar(value="")
 
         self._build_ui()
 
@@ -101,6 +121,58 @@ class ConverterGUI(tk.Tk):
         self.overwrite_check = ttk.Checkbutton(options, text="Overwrite output", variable=self.overwrite_var)
         self.overwrite_check.grid(row=0, column=7, sticky="w")
 
+        ttk.Label(options, text="CPU policy:").grid(row=1, column=0, sticky="w", pady=(8, 0))
+        self.policy_combo = ttk.Combobox(
+            options,
+            textvariable=self.policy_var,
+            values=list(THREAD_POLICIES),
+            state="readonly",
+            width=10,
+        )
+        self.policy_combo.grid(row=1, column=1, padx=(6, 16), pady=(8, 0), sticky="w")
+
+        ttk.Label(options, text="Max size:").grid(row=1, column=2, sticky="w", pady=(8, 0))
+        self.max_dimension_entry = ttk.Entry(options, textvariable=self.max_dimension_var, width=12)
+        self.max_dimension_entry.grid(row=1, column=3, columnspan=2, padx=(6, 16), pady=(8, 0), sticky="w")
+
+        self.cache_check = ttk.Checkbutton(options, text="Use shared cache", variable=self.cache_var)
+        self.cache_check.grid(row=1, column=6, padx=(0, 16), pady=(8, 0), sticky="w")
+
+        self.profile_check = ttk.Checkbutton(options, text="Profile stages", variable=self.profile_var)
+        self.profile_check.grid(row=1, column=7, pady=(8, 0), sticky="w")
+
+        ttk.Label(options, text="Memory limit:").grid(row=2, column=0, sticky="w", pady=(8, 0))
+        self.memory_budget_entry = ttk.Entry(options, textvariable=self.memory_budget_var, width=12)
+        self.memory_budget_entry.grid(row=2, column=1, padx=(6, 16), pady=(8, 0), sticky="w")
+
+        ttk.Label(options, text="Preset:").grid(row=2, column=2, sticky="w", pady=(8, 0))
+        self.preset_combo = ttk.Combobox(
+            options,
+            textvariable=self.preset_var,
+            values=list(EFFORT_PRESETS),
+            state="readonly",
+            width=10,
+        )
+        self.preset_combo.grid(row=2, column=3, padx=(6, 16), pady=(8, 0), sticky="w")
+
+        ttk.Label(options, text="WebP method:").grid(row=2, column=4, sticky="w", pady=(8, 0))
+        self.webp_method_spin = ttk.Spinbox(options, from_=0, to=6, textvariable=self.webp_method_var, width=6)
+        self.webp_method_spin.grid(row=2, column=5, padx=(6, 16), pady=(8, 0), sticky="w")
+
+        ttk.Label(options, text="AVIF speed:").grid(row=2, column=6, sticky="w", pady=(8, 0))
+        self.avif_speed_spin = ttk.Spinbox(options, from_=0, to=10, textvariable=self.avif_speed_var, width=6)
+        self.avif_speed_spin.grid(row=2, column=7, pady=(8, 0), sticky="w")
+
+        ttk.Label(options, text="AVIF subsampling:").grid(row=3, column=0, sticky="w", pady=(8, 0))
+        self.avif_subsampling_combo = ttk.Combobox(
+            options,
+            textvariable=self.avif_subsampling_var,
+            values=[PRESET_SUBSAMPLING, *AVIF_SUBSAMPLING],
+            state="readonly",
+            width=10,
+        )
+        self.avif_subsampling_combo.grid(row=3, column=1, padx=(6, 16), pady=(8, 0), sticky="w")
+
         output = ttk.Frame(top)
         output.grid(row=2, column=0, sticky="ew", pady=(10, 0))
         output.columnconfigure(1, weight=1)
@@ -168,13 +240,7 @@ class ConverterGUI(tk.Tk):
             return
 
         root = Path(folder).resolve()
-        globber = root.rglob if self.recursive_var.get() else root.glob
-        files = [
-            p.resolve()
-            for p in globber("*")
-            if p.is_file() and p.suffix.lower() in {".jpg", ".jpeg"}
-        ]
-        self._merge_files(files)
+        self._merge_files(scan(root, recursive=self.recursive_var.get()), verified=True)
 
     def remove_selected(self) -> None:
         selected_indices = list(self.files_list.curselection())
@@ -194,11 +260,15 @@ class ConverterGUI(tk.Tk):
         if folder:
             self.output_dir_var.set(folder)
 
-    def _merge_files(self, files) -> None:
+    def _merge_files(self, files, verified: bool = False) -> None:
         existing = set(self.selected_files)
-        for file_path in files:
-            if file_path.suffix.lower() in {".jpg", ".jpeg"} and file_path.exists():
-                existing.add(file_path)
+        if verified:
+            # The scanner already filtered on suffix and file type.
+            existing.update(files)
+        else:
+            for file_path in files:
+                if file_path.suffix.lower() in JPEG_SUFFIXES and file_path.exists():
+                    existing.add(file_path)
 
         self.selected_files = sorted(existing)
         self._refresh_file_list()
@@ -226,8 +296,14 @@ class ConverterGUI(tk.Tk):
             self.clear_btn,
             self.quality_spin,
             self.workers_spin,
+            self.max_dimension_entry,
+            self.memory_budget_entry,
+            self.webp_method_spin,
+            self.avif_speed_spin,
             self.recursive_check,
             self.overwrite_check,
+            self.cache_check,
+            self.profile_check,
             self.output_entry,
             self.browse_output_btn,
             self.start_btn,
@@ -235,6 +311,21 @@ class ConverterGUI(tk.Tk):
             widget.configure(state=state)
 
         self.format_combo.configure(state=combo_state)
+        self.policy_combo.configure(state=combo_state)
+        self.preset_combo.configure(state=combo_state)
+
+    @staticmethod
+    def _optional_int(var: tk.StringVar, low: int, high: int, label: str) -> int | None:
+        raw = var.get().strip()
+        if not raw:
+            return None
+        try:
+            value = int(raw)
+        except ValueError:
+            value = low - 1
+        if not low <= value <= high:
+            raise ValueError(f"{label} must be between {low} and {high}, or empty for the preset.")
+        return value
 
     def start_conversion(self) -> None:
         if self.is_running:
@@ -260,7 +351,38 @@ class ConverterGUI(tk.Tk):
             messagebox.showerror("Invalid workers", "Parallel jobs must be between 1 and 32.")
             return
 
-        formats = ["webp", "avif"] if self.format_var.get() == "both" else [self.format_var.get()]
+        try:
+            max_size = parse_max_dimension(self.max_dimension_var.get())
+        except ValueError as err:
+            messagebox.showerror("Invalid max size", str(err))
+            return
+
+        budget = None
+        raw_budget = self.memory_budget_var.get().strip()
+        if raw_budget:
+            try:
+                budget = MemoryBudget(parse_size_bytes(raw_budget))
+            except ValueError as err:
+                messagebox.showerror("Invalid memory limit", str(err))
+                return
+
+        formats = expand_formats(self.format_var.get())
+        # Pool size and AVIF encoder threads share one CPU budget.
+        workers, encoder_threads = plan_threads(workers, self.policy_var.get(), formats=formats)
+        try:
+            overrides = {
+                "method": self._optional_int(self.webp_method_var, 0, 6, "WebP method"),
+                "speed": self._optional_int(self.avif_speed_var, 0, 10, "AVIF speed"),
+            }
+            subsampling = self.avif_subsampling_var.get()
+            if subsampling != PRESET_SUBSAMPLING:
+                overrides["subsampling"] = subsampling
+        except ValueError as err:
+            messagebox.showerror("Invalid encoder option", str(err))
+            return
+        settings = EncodeSettings.from_preset(
+            self.preset_var.get(), quality=quality, max_threads=encoder_threads, **overrides
+        )
 
         if "avif" in formats and not has_avif_encoder():
             messagebox.showerror(
@@ -275,6 +397,19 @@ class ConverterGUI(tk.Tk):
             output_dir = Path(raw_out).expanduser().resolve()
             output_dir.mkdir(parents=True, exist_ok=True)
 
+        trace_path = None
+        if self.profile_var.get():
+            # Never drop the trace next to the user's photos unasked.
+            chosen = filedialog.asksaveasfilename(
+                title="Save profile trace as",
+                initialdir=str(output_dir) if output_dir is not None else None,
+                initialfile="converter-profile.trace.json",
+                defaultextension=".json",
+                filetypes=[("Chrome trace", "*.json"), ("All files", "*.*")],
+            )
+            if chosen:
+                trace_path = Path(chosen).expanduser()
+
         self.is_running = True
         self.total_tasks = len(self.selected_files) * len(formats)
         self.completed_tasks = 0
@@ -285,14 +420,27 @@ class ConverterGUI(tk.Tk):
         self.progress.configure(value=0, maximum=self.total_tasks)
         self.progress_label.configure(text=f"0/{self.total_tasks}")
         self._append_log(
-            f"Starting conversion: {len(self.selected_files)} images, {len(formats)} format(s), {workers} parallel jobs"
+            f"Starting conversion: {len(self.selected_files)} images, {len(formats)} format(s), "
+            f"{workers} parallel jobs x {encoder_threads} encoder thread(s)"
         )
 
         self._set_controls_enabled(False)
 
         thread = threading.Thread(
             target=self._run_conversion,
-            args=(self.selected_files.copy(), formats, quality, output_dir, self.overwrite_var.get(), workers),
+            args=(
+                self.selected_files.copy(),
+                formats,
+                settings,
+                output_dir,
+                self.overwrite_var.get(),
+                workers,
+                max_size,
+                open_cache(DEFAULT_CACHE_DIR) if self.cache_var.get() else None,
+                budget,
+                Profiler() if self.profile_var.get() else None,
+                trace_path,
+            ),
             daemon=True,
         )
         thread.start()
@@ -302,23 +450,30 @@ class ConverterGUI(tk.Tk):
         self,
         files: list[Path],
         formats: list[str],
-        quality: int,
+        settings: EncodeSettings,
         output_dir: Path | None,
         overwrite: bool,
         workers: int,
+        max_size: tuple[int, int] | None = None,
+        cache: OutputCache | None = None,
+        budget: MemoryBudget | None = None,
+        profiler: Profiler | None = None,
+        trace_path: Path | None = None,
     ) -> None:
-        def convert_one(src: Path, dest: Path, fmt: str) -> tuple[str, str]:
-            if dest.exists() and not overwrite:
-                return "skip", f"[SKIP] {dest}"
-
-            dest.parent.mkdir(parents=True, exist_ok=True)
-            with Image.open(src) as im:
-                im.convert("RGB").save(dest, format=fmt.upper(), quality=quality)
-
-            return "ok", f"[OK] {src.name} -> {dest}"
+        def convert_one(src: Path, outputs: list[tuple[str, Path]]) -> list[tuple[str, str]]:
+            messages = []
+            for result in convert_file(
+                src, outputs, settings=settings, overwrite=overwrite, max_size=max_size, cache=cache
+            ):
+                if result.status == "skip":
+                    messages.append(("skip", f"[SKIP] {result.dest}"))
+                else:
+                    suffix = " (cached)" if result.cached else ""
+                    messages.append(("ok", f"[OK] {src.name} -> {result.dest}{suffix}"))
+            return messages
 
         def choose_dest(src: Path, fmt: str, claimed: set[Path]) -> Path:
-            ext = ".webp" if fmt == "webp" else ".avif"
+            ext = EXTENSIONS[fmt]
             if output_dir is None:
                 return src.with_suffix(ext)
 
@@ -335,21 +490,44 @@ class ConverterGUI(tk.Tk):
                     return candidate
                 index += 1
 
-        futures = []
+        def finish(future: Future, count: int, held: int) -> None:
+            if held:
+                budget.release(held)
+            try:
+                for status, message in future.result():
+                    self.ui_queue.put(("item", status, message))
+            except Exception as err:
+                for _ in range(count):
+                    self.ui_queue.put(("item", "error", f"[ERROR] {err}"))
+
         claimed_paths: set[Path] = set()
         with ThreadPoolExecutor(max_workers=workers) as executor:
             for src in files:
-                for fmt in formats:
-                    dest = choose_dest(src, fmt, claimed_paths)
-                    futures.append(executor.submit(convert_one, src, dest, fmt))
-
-            for future in as_completed(futures):
+                # One task per source so the JPEG is decoded once for all formats.
+                outputs = [(fmt, choose_dest(src, fmt, claimed_paths)) for fmt in formats]
+                # Admission blocks here, before the pool, so large images
+                # queue up instead of all decoding at once.
+                held = budget.acquire(estimate_source(src, formats, max_size)) if budget is not None else 0
+                if profiler is not None:
+                    future = executor.submit(profiler.call, convert_one, src, outputs)
+                else:
+                    future = executor.submit(convert_one, src, outputs)
+                future.add_done_callback(functools.partial(finish, count=len(outputs), held=held))
+
+        if cache is not None:
+            self.ui_queue.put(("log", None, f"[CACHE] {cache.summary()}"))
+        if profiler is not None:
+            profiler.finish()
+            for line in profiler.summary_lines():
+                self.ui_queue.put(("log", None, f"[PROFILE] {line}"))
+            if trace_path is None:
+                self.ui_queue.put(("log", None, "[PROFILE] No trace file chosen; stage totals only."))
+            else:
                 try:
-                    status, message = future.result()
-                    self.ui_queue.put(("item", status, message))
-                except Exception as err:
-                    self.ui_queue.put(("item", "error", f"[ERROR] {err}"))
-
+                    profiler.export(trace_path, "chrome")
+                    self.ui_queue.put(("log", None, f"[PROFILE] Chrome trace written to {trace_path.resolve()}"))
+                except OSError as err:
+                    self.ui_queue.put(("log", None, f"[PROFILE] Could not write trace to {trace_path}: {err}"))
         self.ui_queue.put(("done", None, None))
 
     def _drain_queue(self) -> None:
@@ -372,6 +550,9 @@ class ConverterGUI(tk.Tk):
                 self.progress_label.configure(text=f"{self.completed_tasks}/{self.total_tasks}")
                 self._append_log(message)
 
+            elif event == "log":
+                self._append_log(message)
+
             elif event == "done":
                 self.is_running = False
                 self._set_controls_enabled(True)
@@ -0,0 +1,72 @@
+"""Sidecar fingerprint index that lets reruns skip outputs that are still current."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict
+
+INDEX_NAME = ".converter-index.json"
+INDEX_VERSION = 1
+
+
+def hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FingerprintIndex:
+    """Maps each output path to the source fingerprint and settings that produced it.
+
+    A source fingerprint is its size and mtime, or its SHA-256 when
+    ``use_hash`` is set. The index is a single JSON file that is loaded once
+    and rewritten atomically by :meth:`save`.
+    """
+
+    def __init__(self, path: Path, use_hash: bool = False) -> None:
+        self.path = path
+        self.use_hash = use_hash
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+
+        try:
+            with path.open("r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            # A corrupt index only costs a full reconversion.
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.entries = data.get("outputs", {})
+
+    def fingerprint(self, src: Path) -> Dict[str, Any]:
+        st = src.stat()
+        if self.use_hash:
+            return {"size": st.st_size, "sha256": hash_file(src)}
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def is_current(self, dest: Path, fingerprint: Dict[str, Any], settings_key: str) -> bool:
+        entry = self.entries.get(str(dest))
+        if entry is None or entry.get("source") != fingerprint or entry.get("settings") != settings_key:
+            return False
+        return dest.exists()
+
+    def record(self, dest: Path, src: Path, fingerprint: Dict[str, Any], settings_key: str) -> None:
+        self.entries[str(dest)] = {"src": str(src), "source": fingerprint, "settings": settings_key}
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump({"version": INDEX_VERSION, "outputs": self.entries}, fh, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.dirty = False
@@ -0,0 +1,188 @@
+"""Bounded store for web jobs: TTL expiry, an LRU byte cap on finished artifacts and a reaper thread."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict
+
+# Finished jobs are dropped this long after they finish, or this long after
+# their first download, whichever comes first.
+DEFAULT_TTL = 30 * 60.0
+DEFAULT_DOWNLOAD_TTL = 5 * 60.0
+REAP_INTERVAL = 30.0
+# How many dropped job ids are remembered so their URLs answer 410, not 404.
+TOMBSTONES = 10_000
+
+FINISHED = ("done", "error")
+
+
+class JobGone(Exception):
+    """The job existed but was dropped; ``reason`` is ``expired`` or ``evicted``."""
+
+    def __init__(self, job_id: str, reason: str) -> None:
+        super().__init__(f"Job {job_id} was {reason}.")
+        self.job_id = job_id
+        self.reason = reason
+
+
+class JobStore:
+    """Thread-safe job table whose finished artifacts are bounded in count, age and bytes.
+
+    Jobs are plain dicts; a finished job's ``artifact`` is a file the store
+    owns and deletes when the job is dropped. Queued and running jobs are
+    never dropped. Finished jobs expire after ``ttl`` seconds, or
+    ``download_ttl`` seconds after their first download (long enough to
+    retry it). Whenever artifacts exceed ``max_bytes``, the least recently
+    finished or downloaded ones are evicted first. :meth:`reap` applies the
+    TTLs; :meth:`start_reaper` runs it in the background.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: float = DEFAULT_TTL,
+        download_ttl: float = DEFAULT_DOWNLOAD_TTL,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.download_ttl = download_ttl
+        self.resident_bytes = 0
+        self.expired = 0
+        self.evicted = 0
+        # Oldest access first, so eviction pops from the front.
+        self._jobs: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._gone: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._reaper: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def create(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            self._jobs[job_id] = {"state": "queued", "completed": 0, "total": 0, "error": None, **fields}
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def finish(self, job_id: str, artifact: Path, **fields: Any) -> None:
+        """Mark a job done with its ``artifact`` file, evicting older artifacts past the byte cap."""
+        size = artifact.stat().st_size
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                artifact.unlink(missing_ok=True)
+                return
+            job.update(fields, state="done", artifact=artifact, size=size, finished_at=time.monotonic())
+            self._jobs.move_to_end(job_id)
+            self.resident_bytes += size
+            self._evict_over_cap()
+
+    def fail(self, job_id: str, error: str) -> None:
+        self.update(job_id, state="error", error=error, finished_at=time.monotonic())
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        """A snapshot of the job, ``None`` if it never existed; raises :class:`JobGone` if it was dropped."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                self._raise_if_gone(job_id)
+                return None
+            return dict(job)
+
+    def download(self, job_id: str) -> Dict[str, Any] | None:
+        """Like :meth:`get`, but counts as a use of the artifact and starts its download TTL."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                self._raise_if_gone(job_id)
+                return None
+            if job["state"] == "done":
+                job.setdefault("downloaded_at", time.monotonic())
+                self._jobs.move_to_end(job_id)
+            return dict(job)
+
+    def pop(self, job_id: str) -> Dict[str, Any] | None:
+        """Remove a job without deleting its artifact, which becomes the caller's."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is not None:
+                self.resident_bytes -= job.get("size", 0)
+            return job
+
+    def reap(self) -> int:
+        """Drop finished jobs past their TTL; returns how many were dropped."""
+        now = time.monotonic()
+        with self._lock:
+            stale = []
+            for job_id, job in self._jobs.items():
+                if job["state"] not in FINISHED:
+                    continue
+                deadline = job["finished_at"] + self.ttl
+                if "downloaded_at" in job:
+                    deadline = min(deadline, job["downloaded_at"] + self.download_ttl)
+                if now >= deadline:
+                    stale.append(job_id)
+            for job_id in stale:
+                self._drop(job_id, "expired")
+            self.expired += len(stale)
+            return len(stale)
+
+    def start_reaper(self, interval: float = REAP_INTERVAL) -> None:
+        if self._reaper is not None:
+            return
+
+        def loop() -> None:
+            while not self._stop.wait(interval):
+                self.reap()
+
+        self._reaper = threading.Thread(target=loop, name="job-reaper", daemon=True)
+        self._reaper.start()
+
+    def stop_reaper(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states: Dict[str, int] = {}
+            for job in self._jobs.values():
+                states[job["state"]] = states.get(job["state"], 0) + 1
+            return {
+                "jobs": len(self._jobs),
+                "states": states,
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "download_ttl_s": self.download_ttl,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+    def _raise_if_gone(self, job_id: str) -> None:
+        reason = self._gone.get(job_id)
+        if reason is not None:
+            raise JobGone(job_id, reason)
+
+    def _evict_over_cap(self) -> None:
+        # The newest artifact always stays, even if it alone is over the cap.
+        newest = next(reversed(self._jobs))
+        for job_id in list(self._jobs):
+            if self.resident_bytes <= self.max_bytes or job_id == newest:
+                break
+            if self._jobs[job_id].get("size"):
+                self._drop(job_id, "evicted")
+                self.evicted += 1
+
+    def _drop(self, job_id: str, reason: str) -> None:
+        job = self._jobs.pop(job_id)
+        self.resident_bytes -= job.get("size", 0)
+        if "artifact" in job:
+            # A download already in progress keeps reading the unlinked file.
+            job["artifact"].unlink(missing_ok=True)
+        self._gone[job_id] = reason
+        if len(self._gone) > TOMBSTONES:
+            self._gone.popitem(last=False)
@@ -0,0 +1,148 @@
+"""SQLite work ledger that lets an interrupted CLI batch resume where it stopped."""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+from engine import Result
+
+STATES = ("planned", "in_flight", "done", "failed")
+
+# Marks are committed in batches; a crash loses at most this much progress,
+# and those items are simply redone.
+COMMIT_INTERVAL = 0.5
+
+
+class Ledger:
+    """Per-source state (planned, in_flight, done, failed) with attempt counts.
+
+    Opening a ledger returns items left ``in_flight`` by a killed run to
+    ``planned``. :meth:`track` filters a task stream down to sources that are
+    not done and have not used up their retries. Each row carries the run
+    signature (output paths and encoder settings) it was planned with; a row
+    from a run with a different signature counts as new work.
+    """
+
+    def __init__(self, path: Path, max_attempts: int = 3) -> None:
+        self.path = path
+        self.max_attempts = max_attempts
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "src TEXT PRIMARY KEY, state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "error TEXT, updated REAL NOT NULL, signature TEXT)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(items)")}
+        if "signature" not in columns:
+            # Ledgers from before signatures: their rows match no run and are redone.
+            self.db.execute("ALTER TABLE items ADD COLUMN signature TEXT")
+        self.db.execute("UPDATE items SET state = 'planned' WHERE state = 'in_flight'")
+
+        self.done: Dict[str, str | None] = dict(
+            self.db.execute("SELECT src, signature FROM items WHERE state = 'done'").fetchall()
+        )
+        self.attempts: Dict[str, Tuple[int, str | None]] = {
+            src: (attempts, signature)
+            for src, attempts, signature in self.db.execute(
+                "SELECT src, attempts, signature FROM items WHERE state = 'failed'"
+            )
+        }
+        self.resumed = 0
+        self.exhausted = 0
+        self._last_commit = time.monotonic()
+        self.db.execute("BEGIN")
+
+    def _maybe_commit(self) -> None:
+        if time.monotonic() - self._last_commit >= COMMIT_INTERVAL:
+            self.commit()
+
+    def track(
+        self, tasks: Iterable[Tuple[Path, list]], signature: Callable[[list], str]
+    ) -> Iterator[Tuple[Path, list]]:
+        """Yield the tasks still to do, recording each as ``planned`` and then ``in_flight``.
+
+        ``signature(outputs)`` identifies what a task produces. A task moves
+        to ``in_flight`` once the consumer asks for the next one, i.e. after
+        it has been handed to a worker.
+        """
+        taken: str | None = None
+        for src, outputs in tasks:
+            key = str(src)
+            sig = signature(outputs)
+            if key in self.done and self.done[key] == sig:
+                self.resumed += 1
+                continue
+            attempts, failed_sig = self.attempts.get(key, (0, None))
+            if failed_sig != sig:
+                attempts = 0
+            if attempts >= self.max_attempts:
+                self.exhausted += 1
+                continue
+
+            self.db.execute(
+                "INSERT INTO items (src, state, attempts, updated, signature) VALUES (?, 'planned', ?, ?, ?) "
+                "ON CONFLICT(src) DO UPDATE SET state = 'planned', attempts = excluded.attempts, "
+                "updated = excluded.updated, signature = excluded.signature",
+                (key, attempts, time.time(), sig),
+            )
+            self._start(taken)
+            taken = key
+            self._maybe_commit()
+            yield src, outputs
+        self._start(taken)
+
+    def _start(self, key: str | None) -> None:
+        # Only a planned row moves: a sequential consumer may already have finished it.
+        if key is not None:
+            self.db.execute(
+                "UPDATE items SET state = 'in_flight', updated = ? WHERE src = ? AND state = 'planned'",
+                (time.time(), key),
+            )
+
+    def reset(self, src: Path) -> None:
+        """Forget that ``src`` was done or failed, e.g. because it changed on disk."""
+        key = str(src)
+        self.done.pop(key, None)
+        self.attempts.pop(key, None)
+        self.db.execute("UPDATE items SET state = 'planned', attempts = 0, error = NULL WHERE src = ?", (key,))
+
+    def commit(self) -> None:
+        self.db.execute("COMMIT")
+        self.db.execute("BEGIN")
+        self._last_commit = time.monotonic()
+
+    def finish(self, src: Path, results: List[Result]) -> None:
+        errors = [r.note for r in results if r.status == "error"]
+        if errors:
+            self.db.execute(
+                "UPDATE items SET state = 'failed', attempts = attempts + 1, error = ?, updated = ? WHERE src = ?",
+                ("; ".join(errors), time.time(), str(src)),
+            )
+        else:
+            self.db.execute(
+                "UPDATE items SET state = 'done', error = NULL, updated = ? WHERE src = ?",
+                (time.time(), str(src)),
+            )
+        self._maybe_commit()
+
+    def counts(self) -> Dict[str, int]:
+        out = {state: 0 for state in STATES}
+        out.update(self.db.execute("SELECT state, COUNT(*) FROM items GROUP BY state").fetchall())
+        return out
+
+    def close(self) -> None:
+        self.db.execute("COMMIT")
+        self.db.close()
+
+    def summary(self) -> str:
+        c = self.counts()
+        return (
+            f"done={c['done']} failed={c['failed']} pending={c['planned'] + c['in_flight']} "
+            f"skipped-as-done={self.resumed} retries-exhausted={self.exhausted}"
+        )
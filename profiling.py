@@ -0,0 +1,209 @@
+"""Optional per-stage timing of conversions, with text, JSON and Chrome trace reports."""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path, PurePath
+from typing import Any, Callable, ContextManager, Dict, List, Tuple
+
+# Stages the engine marks, in pipeline order.
+STAGES = ("read", "decode", "convert", "resize", "encode", "score", "write")
+EXPORT_FORMATS = ("json", "chrome")
+
+_local = threading.local()
+_NOOP = contextlib.nullcontext()
+
+Span = Tuple[str, float, float]
+
+
+@dataclass
+class Trace:
+    """Stage spans of one task, recorded in whichever thread or process ran it."""
+
+    name: str
+    pid: int
+    tid: int
+    start: float
+    end: float
+    spans: List[Span] = field(default_factory=list)
+
+
+class _Stage:
+    __slots__ = ("spans", "name", "start")
+
+    def __init__(self, spans: List[Span], name: str) -> None:
+        self.spans = spans
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc: object) -> None:
+        self.spans.append((self.name, self.start, time.perf_counter()))
+
+
+def enabled() -> bool:
+    return getattr(_local, "spans", None) is not None
+
+
+def stage(name: str) -> ContextManager[None]:
+    """Time a stage of the current task; a shared no-op when the task is not profiled."""
+    spans = getattr(_local, "spans", None)
+    if spans is None:
+        return _NOOP
+    return _Stage(spans, name)
+
+
+def profiled(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Tuple[Any, Trace]:
+    """Run ``func`` with stage timing on and return ``(result, trace)``.
+
+    The trace is plain data, so it survives the trip back from a process pool.
+    ``perf_counter`` is a system-wide monotonic clock on the platforms we run
+    on, which keeps spans from different workers on one timeline.
+    """
+    # Name the task after its source: the first path or file name argument.
+    name = next(
+        (getattr(arg, "name", arg) for arg in args if isinstance(arg, (str, PurePath))),
+        getattr(func, "__name__", "task"),
+    )
+    spans: List[Span] = []
+    _local.spans = spans
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        _local.spans = None
+    return result, Trace(name, os.getpid(), threading.get_ident(), start, time.perf_counter(), spans)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def histogram(samples: List[float]) -> Dict[str, int]:
+    """Counts per power-of-two millisecond bucket, e.g. ``{"<=8ms": 12}``."""
+    counts: Dict[int, int] = {}
+    for seconds in samples:
+        bound = 1
+        while bound < seconds * 1000:
+            bound *= 2
+        counts[bound] = counts.get(bound, 0) + 1
+    return {f"<={bound}ms": counts[bound] for bound in sorted(counts)}
+
+
+class Profiler:
+    """Collects :class:`Trace` objects from workers and summarizes them."""
+
+    def __init__(self) -> None:
+        self.traces: List[Trace] = []
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace) -> None:
+        with self._lock:
+            self.traces.append(trace)
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run ``func`` in this process with profiling on and keep its trace."""
+        result, trace = profiled(func, *args, **kwargs)
+        self.add(trace)
+        return result
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+
+    def wall(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def _workers(self) -> Dict[Tuple[int, int], float]:
+        busy: Dict[Tuple[int, int], float] = {}
+        for trace in self.traces:
+            key = (trace.pid, trace.tid)
+            busy[key] = busy.get(key, 0.0) + trace.end - trace.start
+        return busy
+
+    def stats(self) -> Dict[str, Any]:
+        durations: Dict[str, List[float]] = {}
+        for trace in self.traces:
+            for name, start, end in trace.spans:
+                durations.setdefault(name, []).append(end - start)
+
+        stages = {}
+        for name in sorted(durations, key=lambda n: STAGES.index(n) if n in STAGES else len(STAGES)):
+            samples = durations[name]
+            stages[name] = {
+                "count": len(samples),
+                "total_s": round(sum(samples), 6),
+                "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+                "p50_ms": round(percentile(samples, 50) * 1000, 3),
+                "p95_ms": round(percentile(samples, 95) * 1000, 3),
+                "histogram": histogram(samples),
+            }
+
+        wall = self.wall()
+        busy = self._workers()
+        return {
+            "wall_s": round(wall, 6),
+            "tasks": len(self.traces),
+            "workers": len(busy),
+            "utilization": round(sum(busy.values()) / (wall * len(busy)), 4) if busy and wall else 0.0,
+            "worker_utilization": [round(b / wall, 4) if wall else 0.0 for b in busy.values()],
+            "stages": stages,
+        }
+
+    def summary_lines(self) -> List[str]:
+        s = self.stats()
+        workers = " ".join(f"{u:.0%}" for u in s["worker_utilization"])
+        lines = [
+            f"wall {s['wall_s']:.2f}s, {s['tasks']} task(s) on {s['workers']} worker(s), "
+            f"utilization {s['utilization']:.0%} ({workers})",
+            f"{'stage':<8} {'count':>6} {'total s':>9} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}",
+        ]
+        for name, st in s["stages"].items():
+            lines.append(
+                f"{name:<8} {st['count']:>6} {st['total_s']:>9.3f} {st['mean_ms']:>9.1f} "
+                f"{st['p50_ms']:>9.1f} {st['p95_ms']:>9.1f}"
+            )
+        for name, st in s["stages"].items():
+            buckets = " ".join(f"{bucket}:{count}" for bucket, count in st["histogram"].items())
+            lines.append(f"{name:<8} {buckets}")
+        return lines
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Chrome/Perfetto ``traceEvents``: one lane per worker, tasks with their stages nested."""
+        events: List[Dict[str, Any]] = []
+        lanes: Dict[Tuple[int, int], int] = {}
+        for trace in sorted(self.traces, key=lambda t: t.start):
+            lane = lanes.setdefault((trace.pid, trace.tid), len(lanes) + 1)
+            events.append(self._event(trace.name, "task", trace.start, trace.end, trace.pid, lane))
+            for name, start, end in trace.spans:
+                events.append(self._event(name, "stage", start, end, trace.pid, lane))
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def _event(self, name: str, cat: str, start: float, end: float, pid: int, lane: int) -> Dict[str, Any]:
+        return {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": round((start - self.started) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": pid,
+            "tid": lane,
+        }
+
+    def export(self, path: Path, fmt: str = "json") -> None:
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown profile format: {fmt}")
+        data = self.chrome_trace() if fmt == "chrome" else self.stats()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as fh:
+            json.dump(data, fh, indent=None if fmt == "chrome" else 2)
+            fh.write("\n")
@@ -0,0 +1,108 @@
+"""Fast os.scandir-based discovery of JPEG files shared by the CLI and Tk GUI."""
+
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+from engine import JPEG_SUFFIXES
+
+
+@dataclass
+class ScanStats:
+    entries: int = 0
+    dirs: int = 0
+    matched: int = 0
+    # Seconds spent inside the scanner, excluding time the consumer holds a
+    # yielded path, so streaming conversion does not distort the rate.
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.entries / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.entries} entries in {self.dirs} dir(s), {self.matched} matched, "
+            f"{self.elapsed:.2f}s ({self.rate:,.0f} entries/s)"
+        )
+
+
+def _matches(rel: str, patterns: Sequence[str]) -> bool:
+    return any(fnmatchcase(rel, pattern) for pattern in patterns)
+
+
+def selected(rel: str, include: Sequence[str] = (), exclude: Sequence[str] = ()) -> bool:
+    """Whether a file at relative path ``rel`` passes the ``include``/``exclude`` filters of :func:`scan`."""
+    if include and not _matches(rel, include):
+        return False
+    return not (exclude and _matches(rel, exclude))
+
+
+def excluded_dir(rel: str, exclude: Sequence[str] = ()) -> bool:
+    return bool(exclude) and _matches(rel, exclude)
+
+
+def scan(
+    root: Path | str,
+    recursive: bool = True,
+    suffixes: Iterable[str] = JPEG_SUFFIXES,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    stats: ScanStats | None = None,
+) -> Iterator[Path]:
+    """Yield files under ``root`` whose suffix is in ``suffixes``.
+
+    Suffixes are checked on the entry name before any Path is built, file
+    types come from the cached ``d_type`` of each DirEntry, and nothing is
+    resolved or stat'ed per file. ``include``/``exclude`` are glob patterns
+    matched against the POSIX path relative to ``root``; an excluded
+    directory is not descended into. Symlinked directories are not followed.
+    """
+    suffixes = tuple(s.lower() for s in suffixes)
+    stats = stats if stats is not None else ScanStats()
+    root = os.fspath(root)
+    stack = [(root, "")]
+    resumed = time.perf_counter()
+
+    try:
+        while stack:
+            path, rel_dir = stack.pop()
+            try:
+                it = os.scandir(path)
+            except OSError:
+                continue
+
+            stats.dirs += 1
+            subdirs = []
+            with it:
+                for entry in it:
+                    stats.entries += 1
+                    name = entry.name
+                    rel = f"{rel_dir}{name}"
+                    try:
+                        if recursive and entry.is_dir(follow_symlinks=False):
+                            if not excluded_dir(rel, exclude):
+                                subdirs.append((entry.path, f"{rel}/"))
+                            continue
+                        if not name.lower().endswith(suffixes) or not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+
+                    if not selected(rel, include, exclude):
+                        continue
+
+                    stats.matched += 1
+                    stats.elapsed += time.perf_counter() - resumed
+                    yield Path(entry.path)
+                    resumed = time.perf_counter()
+
+            # Reverse so directories are visited in listing order.
+            stack.extend(reversed(subdirs))
+    finally:
+        stats.elapsed += time.perf_counter() - resumed
@@ -0,0 +1,119 @@
+"""Fair share of the web server's CPUs between concurrent jobs, with a fast lane for small ones."""
+
+from __future__ import annotations
+
+import itertools
+import threading
+from typing import Any, Dict, List
+
+# Jobs with at most this many images are served before larger ones.
+SMALL_JOB = 16
+
+
+class FairScheduler:
+    """Hands out a global budget of ``cpus`` to conversions from many jobs.
+
+    Each job registers with :meth:`add` and calls :meth:`acquire` before every
+    conversion, which blocks until the job is next in line and its
+    conversion's ``cost`` (its encoder threads) fits in the CPUs still free.
+    Jobs of at most ``small_job`` images are served first. Within each lane,
+    the waiting job served least recently goes next, so jobs take turns
+    whatever their size. A job that has not started yet has a queue position.
+    """
+
+    def __init__(self, cpus: int, small_job: int = SMALL_JOB) -> None:
+        self.cpus = max(1, cpus)
+        self.small_job = small_job
+        self.busy = 0
+        self.peak = 0
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def add(self, job_id: str, total: int, cost: int = 1) -> None:
+        with self._cond:
+            self._jobs[job_id] = {
+                "small": total <= self.small_job,
+                "cost": min(max(1, cost), self.cpus),
+                "arrived": next(self._seq),
+                "served": -1,
+                "started": False,
+                "waiting": False,
+                "running": 0,
+                "removed": False,
+            }
+
+    def remove(self, job_id: str) -> None:
+        """Forget a job; conversions it still has running keep their CPUs until released."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["removed"] = True
+            if not job["running"]:
+                del self._jobs[job_id]
+            self._cond.notify_all()
+
+    def acquire(self, job_id: str) -> bool:
+        """Wait for ``job_id``'s turn and a free share of CPUs; returns ``True`` on the job's first grant."""
+        with self._cond:
+            job = self._jobs[job_id]
+            job["waiting"] = True
+            try:
+                while self._next() != job_id or self.busy + job["cost"] > self.cpus:
+                    self._cond.wait()
+            finally:
+                job["waiting"] = False
+            first = not job["started"]
+            job["started"] = True
+            job["served"] = next(self._seq)
+            job["running"] += 1
+            self.busy += job["cost"]
+            self.peak = max(self.peak, self.busy)
+            # Others may now be next in line, or fit in what is left.
+            self._cond.notify_all()
+            return first
+
+    def release(self, job_id: str) -> None:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job["running"] -= 1
+                self.busy -= job["cost"]
+                if job["removed"] and not job["running"]:
+                    del self._jobs[job_id]
+            self._cond.notify_all()
+
+    def position(self, job_id: str) -> int | None:
+        """1-based place of a job that has not started among those that have not, ``None`` once it runs."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job["started"]:
+                return None
+            queued = [key for key in self._order() if not self._jobs[key]["started"]]
+            return queued.index(job_id) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "cpus": self.cpus,
+                "busy_cpus": self.busy,
+                "peak_cpus": self.peak,
+                "small_job": self.small_job,
+                "jobs": sum(1 for job in self._jobs.values() if not job["removed"]),
+                "running_jobs": sum(1 for job in self._jobs.values() if job["running"] and not job["removed"]),
+                "queued_jobs": sum(1 for job in self._jobs.values() if not job["started"]),
+            }
+
+    def _order(self) -> List[str]:
+        # Small lane first, then least recently served, then first come.
+        return sorted(
+            self._jobs,
+            key=lambda key: (not self._jobs[key]["small"], self._jobs[key]["served"], self._jobs[key]["arrived"]),
+        )
+
+    def _next(self) -> str | None:
+        for job_id in self._order():
+            if self._jobs[job_id]["waiting"]:
+                return job_id
+        return None
@@ -0,0 +1,60 @@
+"""Move image payloads between processes through shared memory instead of pickling."""
+
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+from typing import Tuple
+
+from cache import OutputCache
+from engine import EncodeSettings, Size, convert_bytes
+
+Handle = Tuple[str, int]
+
+
+def put_shared(data: bytes) -> Handle:
+    # Zero-sized segments are rejected by the OS, so always allocate a byte.
+    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    try:
+        shm.buf[: len(data)] = data
+        return shm.name, len(data)
+    finally:
+        shm.close()
+
+
+def take_shared(handle: Handle) -> bytes:
+    """Copy a payload out of shared memory and release the segment."""
+    name, size = handle
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def discard_shared(handle: Handle) -> None:
+    try:
+        shm = shared_memory.SharedMemory(name=handle[0])
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def convert_shared(
+    handle: Handle,
+    filename: str,
+    fmt: str,
+    settings: EncodeSettings,
+    max_size: Size | None = None,
+    cache: OutputCache | None = None,
+) -> tuple[str, Handle, str]:
+    """Process-pool entry point: read the JPEG from ``handle``, return the encode the same way, with its note."""
+    name, size = handle
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        with shm.buf[:size] as raw:
+            (result,) = convert_bytes(raw, filename, [fmt], settings, max_size, cache)
+    finally:
+        shm.close()
+    return str(result.dest), put_shared(result.data), result.note
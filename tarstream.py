@@ -0,0 +1,81 @@
+"""Tar-stream input and output, so batches can be piped through the converter without touching disk."""
+
+from __future__ import annotations
+
+import io
+import tarfile
+from collections import deque
+from pathlib import PurePosixPath
+from typing import BinaryIO, Deque, Iterable, Iterator, List, Sequence, Tuple
+
+from engine import JPEG_SUFFIXES
+from scanner import selected
+
+
+class TarReader:
+    """Yields ``(name, [data])`` tasks for the JPEG members of a tar stream, in stream order.
+
+    The archive is read strictly forwards (``r|*``, any compression), so it
+    can come from a pipe. Each member's bytes are read as it is reached; how
+    many are held at once is up to the consumer. Other regular files are
+    counted in :attr:`skipped` and dropped; directories, links and other
+    non-file members are dropped without counting. :attr:`members` queues the
+    ``TarInfo`` of every yielded task, for consumers that finish tasks in
+    order.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        suffixes: Iterable[str] = JPEG_SUFFIXES,
+    ) -> None:
+        self.tar = tarfile.open(fileobj=fileobj, mode="r|*")
+        self.include = include
+        self.exclude = exclude
+        self.suffixes = tuple(s.lower() for s in suffixes)
+        self.members: Deque[tarfile.TarInfo] = deque()
+        self.skipped = 0
+
+    def __iter__(self) -> Iterator[Tuple[PurePosixPath, List[bytes]]]:
+        for member in self.tar:
+            # TarFile keeps every TarInfo it has read; a stream never seeks
+            # back, so drop them to keep memory flat on huge archives.
+            self.tar.members.clear()
+            if not member.isfile():
+                continue
+            name = member.name.lstrip("/")
+            if not (name.lower().endswith(self.suffixes) and selected(name, self.include, self.exclude)):
+                self.skipped += 1
+                continue
+            fh = self.tar.extractfile(member)
+            if fh is None:
+                self.skipped += 1
+                continue
+            self.members.append(member)
+            yield PurePosixPath(name), [fh.read()]
+
+    def close(self) -> None:
+        self.tar.close()
+
+
+class TarWriter:
+    """Writes outputs as a forward-only tar stream, e.g. to stdout."""
+
+    def __init__(self, fileobj: BinaryIO) -> None:
+        self.tar = tarfile.open(fileobj=fileobj, mode="w|", format=tarfile.PAX_FORMAT)
+
+    def add(self, name: PurePosixPath, data: bytes, like: tarfile.TarInfo | None = None) -> None:
+        """Append ``data`` as ``name``, copying mtime, mode and owner from the source member ``like``."""
+        info = tarfile.TarInfo(str(name))
+        info.size = len(data)
+        if like is not None:
+            info.mtime = like.mtime
+            info.mode = like.mode
+            info.uid, info.gid = like.uid, like.gid
+            info.uname, info.gname = like.uname, like.gname
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self) -> None:
+        self.tar.close()
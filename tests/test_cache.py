@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import io
+import itertools
+import pickle
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import cache as cache_module
+from cache import OutputCache, open_cache
+from engine import EncodeSettings, convert_bytes
+
+
+@pytest.fixture(autouse=True)
+def ticking_clock(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Every access gets a distinct time, so LRU order never ties.
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def jpeg(color: str) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 24), color).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def test_least_recently_used_entries_are_evicted_past_the_limit(tmp_path: Path) -> None:
+    cache = OutputCache(tmp_path, max_bytes=25)
+    cache.put("a" * 64, b"1" * 10)
+    cache.put("b" * 64, b"2" * 10)
+    assert cache.get("a" * 64) == b"1" * 10
+
+    cache.put("c" * 64, b"3" * 10)
+
+    assert cache.get("b" * 64) is None
+    assert cache.get("a" * 64) == b"1" * 10
+    assert not (tmp_path / "bb" / ("b" * 64)).exists()
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 20, 1)
+
+
+def test_opening_with_a_smaller_limit_trims_at_once(tmp_path: Path) -> None:
+    cache = OutputCache(tmp_path, max_bytes=100)
+    for name in "abcd":
+        cache.put(name * 64, b"x" * 20)
+
+    smaller = OutputCache(tmp_path, max_bytes=45)
+
+    assert smaller.stats()["bytes"] == 40
+    assert smaller.get("a" * 64) is None and smaller.get("b" * 64) is None
+    assert smaller.get("d" * 64) is not None
+
+
+def test_same_source_bytes_are_encoded_once_per_settings(tmp_path: Path) -> None:
+    cache = OutputCache(tmp_path)
+    raw = jpeg("teal")
+    settings = EncodeSettings(quality=70)
+
+    (first,) = convert_bytes(raw, "a.jpg", ["webp"], settings, None, cache)
+    (renamed,) = convert_bytes(raw, "copy/b.jpg", ["webp"], settings, None, cache)
+    (other_quality,) = convert_bytes(raw, "a.jpg", ["webp"], EncodeSettings(quality=40), None, cache)
+    (other_source,) = convert_bytes(jpeg("olive"), "a.jpg", ["webp"], settings, None, cache)
+
+    assert not first.cached and renamed.cached
+    assert renamed.data == first.data
+    assert renamed.dest == Path("b.webp")
+    assert not other_quality.cached and not other_source.cached
+    assert cache.stats()["writes"] == 3
+
+
+def test_pickled_cache_reopens_the_process_wide_instance(tmp_path: Path) -> None:
+    cache = open_cache(tmp_path, 1000)
+
+    assert open_cache(tmp_path, 1000) is cache
+    assert pickle.loads(pickle.dumps(cache)) is cache
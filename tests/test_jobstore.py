@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import jobstore
+import web_gui
+from jobstore import JobGone, JobStore
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(jobstore, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def finished(store: JobStore, tmp_path: Path, job_id: str, size: int = 10) -> Path:
+    artifact = tmp_path / f"{job_id}.zip"
+    artifact.write_bytes(b"x" * size)
+    store.create(job_id)
+    store.finish(job_id, artifact)
+    return artifact
+
+
+def test_finished_jobs_expire_after_the_ttl(tmp_path: Path, clock: Clock) -> None:
+    store = JobStore(max_bytes=10**6, ttl=60, download_ttl=5)
+    artifact = finished(store, tmp_path, "old")
+    store.create("running", state="running")
+
+    clock.now += 59
+    assert store.reap() == 0
+    clock.now += 1
+    assert store.reap() == 1
+
+    assert not artifact.exists()
+    assert store.get("running")["state"] == "running"
+    with pytest.raises(JobGone) as err:
+        store.get("old")
+    assert err.value.reason == "expired"
+    assert store.stats()["expired"] == 1
+
+
+def test_first_download_starts_the_shorter_download_ttl(tmp_path: Path, clock: Clock) -> None:
+    store = JobStore(max_bytes=10**6, ttl=60, download_ttl=5)
+    finished(store, tmp_path, "fetched")
+    finished(store, tmp_path, "kept")
+
+    clock.now += 10
+    store.download("fetched")
+    clock.now += 4
+    store.download("fetched")  # A retry does not restart the clock.
+    assert store.reap() == 0
+    clock.now += 1
+    assert store.reap() == 1
+    assert store.get("kept") is not None
+
+
+def test_least_recently_used_artifacts_are_evicted_past_the_byte_cap(tmp_path: Path, clock: Clock) -> None:
+    store = JobStore(max_bytes=25)
+    first = finished(store, tmp_path, "first")
+    finished(store, tmp_path, "second")
+    store.download("first")
+
+    finished(store, tmp_path, "third")
+
+    assert first.exists()
+    with pytest.raises(JobGone) as err:
+        store.download("second")
+    assert err.value.reason == "evicted"
+    assert store.stats()["resident_bytes"] == 20
+    assert store.stats()["evicted"] == 1
+
+
+def test_newest_artifact_stays_even_when_alone_over_the_cap(tmp_path: Path, clock: Clock) -> None:
+    store = JobStore(max_bytes=5)
+    store.create("queued")
+    artifact = finished(store, tmp_path, "huge", size=50)
+
+    assert artifact.exists()
+    assert store.get("queued")["state"] == "queued"
+
+
+def test_dropped_jobs_answer_410_and_unknown_ones_404(
+    tmp_path: Path, clock: Clock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    store = JobStore(max_bytes=10**6, ttl=1)
+    finished(store, tmp_path, "old")
+    clock.now += 1
+    store.reap()
+    monkeypatch.setattr(web_gui, "JOBS", store)
+    client = web_gui.app.test_client()
+
+    for url in ("/status/old", "/download/old"):
+        response = client.get(url)
+        assert response.status_code == 410
+        assert response.get_json()["state"] == "expired"
+    assert client.get("/status/never").status_code == 404
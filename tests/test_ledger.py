@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+from PIL import Image
+
+import converter
+from engine import Result
+from ledger import Ledger
+
+
+def states(ledger: Ledger) -> Dict[str, str]:
+    return dict(ledger.db.execute("SELECT src, state FROM items").fetchall())
+
+
+def test_items_are_planned_then_in_flight_and_resume_after_a_crash(tmp_path: Path) -> None:
+    ledger = Ledger(tmp_path / "st.db")
+    tasks = ledger.track([(Path("a.jpg"), ["x"]), (Path("b.jpg"), ["x"])], signature=str)
+
+    next(tasks)
+    assert states(ledger) == {"a.jpg": "planned"}
+    next(tasks)
+    assert states(ledger) == {"a.jpg": "in_flight", "b.jpg": "planned"}
+    ledger.finish(Path("a.jpg"), [Result("ok", "a.jpg", "webp")])
+    assert next(tasks, None) is None
+    assert states(ledger) == {"a.jpg": "done", "b.jpg": "in_flight"}
+    ledger.close()
+
+    # A killed run leaves b in flight; reopening plans it again and skips a.
+    reopened = Ledger(tmp_path / "st.db")
+    assert states(reopened)["b.jpg"] == "planned"
+    todo = [src for src, _ in reopened.track([(Path("a.jpg"), ["x"]), (Path("b.jpg"), ["x"])], signature=str)]
+    assert todo == [Path("b.jpg")]
+    assert reopened.resumed == 1
+
+
+def test_done_rows_only_count_for_the_same_run_signature(tmp_path: Path) -> None:
+    ledger = Ledger(tmp_path / "st.db")
+    for src, _ in ledger.track([(Path("a.jpg"), ["out1/a.webp"])], signature=str):
+        ledger.finish(src, [Result("ok", "a.jpg", "webp")])
+    ledger.close()
+
+    reopened = Ledger(tmp_path / "st.db")
+    assert list(reopened.track([(Path("a.jpg"), ["out1/a.webp"])], signature=str)) == []
+    todo = list(reopened.track([(Path("a.jpg"), ["out2/a.webp"])], signature=str))
+    assert todo == [(Path("a.jpg"), ["out2/a.webp"])]
+
+
+def test_failed_sources_stop_after_max_attempts_until_the_signature_changes(tmp_path: Path) -> None:
+    for _ in range(2):
+        ledger = Ledger(tmp_path / "st.db", max_attempts=2)
+        for src, _ in ledger.track([(Path("bad.jpg"), ["x"])], signature=str):
+            ledger.finish(src, [Result("error", "bad.jpg", "", note="broken")])
+        ledger.close()
+
+    ledger = Ledger(tmp_path / "st.db", max_attempts=2)
+    assert list(ledger.track([(Path("bad.jpg"), ["x"])], signature=str)) == []
+    assert ledger.exhausted == 1
+    assert len(list(ledger.track([(Path("bad.jpg"), ["y"])], signature=str))) == 1
+
+
+def run_cli(monkeypatch: pytest.MonkeyPatch, *args: str) -> int:
+    monkeypatch.setattr(sys, "argv", ["converter.py", *args])
+    return converter.main()
+
+
+def test_reused_state_db_with_another_output_dir_converts_again(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    src = tmp_path / "photo.jpg"
+    Image.new("RGB", (64, 48), "teal").save(src)
+    db = str(tmp_path / "st.db")
+
+    assert run_cli(monkeypatch, str(src), "-f", "webp", "-o", str(tmp_path / "sd1"), "--state-db", db) == 0
+    assert run_cli(monkeypatch, str(src), "-f", "webp", "-o", str(tmp_path / "sd2"), "--state-db", db) == 0
+    assert (tmp_path / "sd2" / "photo.webp").exists()
+
+
+def test_retries_exhausted_exit_non_zero(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    bad = tmp_path / "bad.jpg"
+    bad.write_bytes(b"not a jpeg")
+    args = (str(bad), "-f", "webp", "-o", str(tmp_path / "out"), "--state-db", str(tmp_path / "st.db"))
+
+    assert run_cli(monkeypatch, *args, "--max-attempts", "1") == 4
+    assert run_cli(monkeypatch, *args, "--max-attempts", "1") == 4
@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+import pytest
+
+from engine import plan_threads
+
+
+@pytest.mark.parametrize("policy", ["throughput", "latency"])
+def test_webp_only_uses_one_worker_per_cpu(policy: str) -> None:
+    assert plan_threads(64, policy, 32, ["webp"]) == (32, 1)
+    assert plan_threads(8, policy, 32, ["webp"]) == (8, 1)
+
+
+def test_avif_splits_the_budget_between_workers_and_encoder_threads() -> None:
+    assert plan_threads(64, "latency", 64, ["webp", "avif"]) == (8, 8)
+    assert plan_threads(4, "throughput", 16, ["avif"]) == (4, 4)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import List
+
+from scheduler import FairScheduler
+
+
+def start_waiting(scheduler: FairScheduler, job_id: str, granted: List[str]) -> threading.Thread:
+    """Acquire for ``job_id`` on a thread and return once it is blocked waiting."""
+
+    def run() -> None:
+        scheduler.acquire(job_id)
+        granted.append(job_id)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not scheduler._jobs[job_id]["waiting"] and thread.is_alive():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    return thread
+
+
+def release_and_wait(scheduler: FairScheduler, job_id: str, granted: List[str], count: int) -> None:
+    scheduler.release(job_id)
+    deadline = time.monotonic() + 5
+    while len(granted) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_small_job_goes_ahead_of_a_large_one_that_arrived_first() -> None:
+    scheduler = FairScheduler(1, small_job=4)
+    scheduler.add("big", total=1000)
+    scheduler.add("small", total=3)
+    assert scheduler.acquire("big") is True
+
+    granted: List[str] = []
+    threads = [start_waiting(scheduler, "big", granted), start_waiting(scheduler, "small", granted)]
+    release_and_wait(scheduler, "big", granted, 1)
+
+    assert granted == ["small"]
+    release_and_wait(scheduler, "small", granted, 2)
+    assert granted == ["small", "big"]
+    for thread in threads:
+        thread.join(5)
+
+
+def test_large_jobs_take_turns_one_conversion_at_a_time() -> None:
+    scheduler = FairScheduler(1, small_job=0)
+    scheduler.add("a", total=100)
+    scheduler.add("b", total=100)
+    scheduler.acquire("a")
+
+    granted: List[str] = []
+    start_waiting(scheduler, "a", granted)
+    start_waiting(scheduler, "b", granted)
+    release_and_wait(scheduler, "a", granted, 1)
+    # "a" was just served, so "b" goes first even though "a" arrived earlier.
+    assert granted == ["b"]
+    release_and_wait(scheduler, "b", granted, 2)
+    assert granted == ["b", "a"]
+
+
+def test_conversions_never_take_more_cpus_than_the_budget() -> None:
+    scheduler = FairScheduler(8)
+    scheduler.add("avif", total=100, cost=4)
+    assert scheduler.acquire("avif") and not scheduler.acquire("avif")
+    assert scheduler.busy == 8
+
+    granted: List[str] = []
+    thread = start_waiting(scheduler, "avif", granted)
+    assert granted == []
+    release_and_wait(scheduler, "avif", granted, 1)
+    thread.join(5)
+    assert scheduler.peak == 8
+
+
+def test_queue_position_counts_jobs_not_yet_started() -> None:
+    scheduler = FairScheduler(1, small_job=4)
+    scheduler.add("first", total=50)
+    scheduler.add("second", total=50)
+    scheduler.add("third", total=50)
+    assert [scheduler.position(job) for job in ("first", "second", "third")] == [1, 2, 3]
+
+    scheduler.acquire("first")
+    scheduler.add("small", total=2)
+    assert scheduler.position("first") is None
+    assert [scheduler.position(job) for job in ("small", "second", "third")] == [1, 2, 3]
+    assert scheduler.stats()["queued_jobs"] == 3
+
+    scheduler.remove("second")
+    assert scheduler.position("third") == 2
+    assert scheduler.position("missing") is None
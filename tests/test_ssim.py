@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import io
+
+import pytest
+from PIL import Image
+
+import engine
+from engine import TARGET_EXTRA_ENCODES, EncodeSettings, encode_to_ssim
+from metrics import SSIM_SIDE, luma_plane, ssim
+
+
+def noisy(size: tuple[int, int]) -> Image.Image:
+    # Per-pixel detail is what a downsampled metric averages away.
+    bands = [Image.effect_noise(size, sigma) for sigma in (40, 50, 60)]
+    return Image.merge("RGB", bands)
+
+
+def full_size_ssim(im: Image.Image, data: bytes) -> float:
+    with Image.open(io.BytesIO(data)) as decoded:
+        return ssim(luma_plane(im, side=max(im.size)), luma_plane(decoded, side=max(im.size)))
+
+
+def test_luma_plane_keeps_full_size_and_reduces_by_at_most_two() -> None:
+    assert luma_plane(Image.new("RGB", (SSIM_SIDE, 10))).size == (SSIM_SIDE, 10)
+    assert luma_plane(Image.new("RGB", (SSIM_SIDE * 3, 12))).size == (SSIM_SIDE * 3 // 2, 6)
+
+
+@pytest.mark.parametrize("target", [0.9, 0.95])
+def test_chosen_quality_meets_the_target_at_full_size(target: float, monkeypatch: pytest.MonkeyPatch) -> None:
+    im = noisy((1200, 800))
+    encodes = []
+    encode_bytes = engine.encode_bytes
+
+    def counting(*args, **kwargs) -> bytes:
+        encodes.append(args)
+        return encode_bytes(*args, **kwargs)
+
+    monkeypatch.setattr(engine, "encode_bytes", counting)
+    data, quality, score = encode_to_ssim(im, "webp", EncodeSettings(quality=95, target_ssim=target))
+
+    assert len(encodes) <= 1 + TARGET_EXTRA_ENCODES
+    assert score >= target
+    assert full_size_ssim(im, data) == pytest.approx(score)
+    assert quality < 95
+
+
+def test_unreachable_target_keeps_the_starting_quality() -> None:
+    im = noisy((320, 240))
+    data, quality, score = encode_to_ssim(im, "webp", EncodeSettings(quality=40, target_ssim=0.9999))
+
+    assert quality == 40
+    assert score < 0.9999
+    assert data == engine.encode_bytes(im, "webp", EncodeSettings(quality=40))
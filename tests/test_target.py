@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from typing import List
+
+import pytest
+from PIL import Image
+
+import engine
+from engine import TARGET_EXTRA_ENCODES, EncodeSettings, encode_bytes, encode_to_target
+
+
+@pytest.fixture
+def image() -> Image.Image:
+    return Image.merge("RGB", [Image.effect_noise((480, 320), sigma) for sigma in (30, 45, 60)])
+
+
+@pytest.fixture
+def encodes(monkeypatch: pytest.MonkeyPatch) -> List[int]:
+    """Qualities passed to :func:`engine.encode_bytes`, in call order."""
+    calls: List[int] = []
+
+    def counting(im: Image.Image, fmt: str, settings: EncodeSettings) -> bytes:
+        calls.append(settings.quality)
+        return encode_bytes(im, fmt, settings)
+
+    monkeypatch.setattr(engine, "encode_bytes", counting)
+    return calls
+
+
+@pytest.mark.parametrize("fmt", ["webp", "avif"])
+@pytest.mark.parametrize("fit_quality", [20, 55])
+def test_lands_under_the_target_within_the_encode_budget(
+    image: Image.Image, encodes: List[int], fmt: str, fit_quality: int
+) -> None:
+    if fmt == "avif" and not engine.has_avif_encoder():
+        pytest.skip("AVIF encoder not available")
+    target = len(encode_bytes(image, fmt, EncodeSettings(quality=fit_quality))) + 200
+
+    data, quality = encode_to_target(image, fmt, EncodeSettings(quality=90, target_bytes=target))
+
+    assert len(encodes) <= 1 + TARGET_EXTRA_ENCODES
+    assert encodes[0] == 90
+    assert len(data) <= target
+    # The winner is returned from memory, not encoded a second time.
+    assert encodes.count(quality) == 1
+    assert data == encode_bytes(image, fmt, EncodeSettings(quality=quality))
+
+
+def test_fitting_start_quality_costs_one_encode(image: Image.Image, encodes: List[int]) -> None:
+    data, quality = encode_to_target(image, "webp", EncodeSettings(quality=60, target_bytes=10**9))
+
+    assert (quality, encodes) == (60, [60])
+
+
+def test_unreachable_target_returns_the_smallest_candidate(image: Image.Image, encodes: List[int]) -> None:
+    data, quality = encode_to_target(image, "webp", EncodeSettings(quality=80, target_bytes=100))
+
+    assert len(encodes) <= 1 + TARGET_EXTRA_ENCODES
+    assert len(data) > 100
+    assert quality == min(encodes)
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import io
+import tarfile
+from pathlib import PurePosixPath
+
+from tarstream import TarReader
+
+
+def add(tar: tarfile.TarFile, name: str, data: bytes = b"", kind: bytes = tarfile.REGTYPE) -> None:
+    info = tarfile.TarInfo(name)
+    info.type = kind
+    if kind == tarfile.SYMTYPE:
+        info.linkname = "a.jpg"
+    info.size = len(data) if kind == tarfile.REGTYPE else 0
+    tar.addfile(info, io.BytesIO(data) if kind == tarfile.REGTYPE else None)
+
+
+def test_only_regular_files_that_are_not_converted_count_as_skipped() -> None:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        add(tar, "photos", kind=tarfile.DIRTYPE)
+        add(tar, "photos/a.jpg", b"jpeg-a")
+        add(tar, "photos/link.jpg", kind=tarfile.SYMTYPE)
+        add(tar, "photos/notes.txt", b"text")
+        add(tar, "raw/b.jpeg", b"jpeg-b")
+        add(tar, "fifo.jpg", kind=tarfile.FIFOTYPE)
+    buf.seek(0)
+
+    reader = TarReader(buf, exclude=["raw/*"])
+    tasks = list(reader)
+    reader.close()
+
+    assert tasks == [(PurePosixPath("photos/a.jpg"), [b"jpeg-a"])]
+    assert [member.name for member in reader.members] == ["photos/a.jpg"]
+    assert reader.skipped == 2
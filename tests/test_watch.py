@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+from converter import run_watch
+
+
+class ScriptedWatcher:
+    """Stands in for :class:`watcher.Watcher`, reporting whatever the test lands."""
+
+    def __init__(self) -> None:
+        self.landed: List[Path] = []
+        self.lock = threading.Lock()
+
+    def land(self, path: Path) -> None:
+        with self.lock:
+            self.landed.append(path)
+
+    def wait(self, timeout: float) -> List[Path]:
+        time.sleep(min(timeout, 0.01))
+        with self.lock:
+            landed, self.landed = self.landed, []
+        return landed
+
+
+def test_path_relanded_mid_conversion_is_converted_again_after_it(tmp_path: Path) -> None:
+    src = tmp_path / "photo.jpg"
+    watcher = ScriptedWatcher()
+    stop = threading.Event()
+    first_started = threading.Event()
+    finish_first = threading.Event()
+    lock = threading.Lock()
+    log: List[str] = []
+    active = 0
+    max_active = 0
+
+    def convert(path: Path, outputs: list) -> list:
+        nonlocal active, max_active
+        with lock:
+            active += 1
+            max_active = max(max_active, active)
+            log.append("start")
+        if not first_started.is_set():
+            first_started.set()
+            finish_first.wait(5)
+        with lock:
+            active -= 1
+        return []
+
+    def plan(sources: List[Path]) -> list:
+        log.extend("plan" for _ in sources)
+        return [(path, [("webp", path.with_suffix(".webp"))]) for path in sources]
+
+    yielded: List[Path] = []
+
+    def consume() -> None:
+        for path, _results in run_watch(convert, watcher, plan, jobs=2, executor="thread", stop=stop):
+            log.append("done")
+            yielded.append(path)
+            if len(yielded) == 2:
+                stop.set()
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    try:
+        watcher.land(src)
+        assert first_started.wait(5)
+        watcher.land(src)
+        time.sleep(0.3)
+        assert log == ["plan", "start"]
+    finally:
+        finish_first.set()
+        consumer.join(5)
+        stop.set()
+
+    assert not consumer.is_alive()
+    assert yielded == [src, src]
+    assert max_active == 1
+    # The second copy is planned only after the first task has been reported.
+    assert log == ["plan", "start", "done", "plan", "start", "done"]
@@ -0,0 +1,387 @@
+"""Watch folders for new or rewritten JPEGs, with inotify on Linux and directory polling elsewhere."""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+from engine import JPEG_SUFFIXES
+from scanner import excluded_dir, selected
+
+WATCH_MODES = ("auto", "inotify", "poll")
+
+# A file is handed over once its size and mtime have not changed for this long.
+DEFAULT_SETTLE = 0.5
+DEFAULT_POLL_INTERVAL = 0.25
+# Directory mtimes on SMB/NFS/FAT can be whole seconds, so a file landing in
+# the same tick as a listing leaves the mtime unchanged. Directories modified
+# this recently are listed again on the next poll.
+MTIME_SLACK_NS = 2_000_000_000
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+# Files are picked up when their writer closes them or they are renamed into
+# place; IN_MODIFY only restarts the settle timer of a file already pending.
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE_SELF | _IN_MOVE_SELF
+_EVENT = struct.Struct("iIII")
+
+
+class WatchError(OSError):
+    """The requested watch backend cannot be used on this system."""
+
+
+class _Tree:
+    """Roots being watched and the filters that decide which files count."""
+
+    def __init__(
+        self,
+        roots: Sequence[Path],
+        recursive: bool,
+        include: Sequence[str],
+        exclude: Sequence[str],
+        suffixes: Iterable[str],
+    ) -> None:
+        self.roots = [os.fspath(root) for root in roots]
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.suffixes = tuple(s.lower() for s in suffixes)
+
+    def wanted(self, name: str, rel: str) -> bool:
+        return name.lower().endswith(self.suffixes) and selected(rel, self.include, self.exclude)
+
+    def walk(self, path: str, rel: str, found: List[Path] | None) -> Iterable[Tuple[str, str, List[os.DirEntry]]]:
+        """Yield ``(dir, rel_prefix, entries)`` below ``path``, adding wanted files to ``found``."""
+        stack = [(path, rel)]
+        while stack:
+            path, rel = stack.pop()
+            try:
+                with os.scandir(path) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self.recursive and not excluded_dir(f"{rel}{entry.name}", self.exclude):
+                            stack.append((entry.path, f"{rel}{entry.name}/"))
+                    elif found is not None and entry.is_file() and self.wanted(entry.name, f"{rel}{entry.name}"):
+                        found.append(Path(entry.path))
+                except OSError:
+                    continue
+            yield path, rel, entries
+
+
+class _Inotify:
+    """Recursive inotify watches driven through libc with ctypes."""
+
+    def __init__(self, tree: _Tree) -> None:
+        if not sys.platform.startswith("linux"):
+            raise WatchError("inotify is only available on Linux.")
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._rm_watch = libc.inotify_rm_watch
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError) as err:
+            raise WatchError(f"inotify is not available: {err}") from err
+        if fd < 0:
+            raise WatchError(ctypes.get_errno(), f"inotify_init1 failed: {os.strerror(ctypes.get_errno())}")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = fd
+        self.tree = tree
+        self.dirs: Dict[int, Tuple[str, str]] = {}
+        self._complete_before = time.time_ns()
+        try:
+            for root in tree.roots:
+                self._watch_tree(root, "", None)
+        except OSError:
+            self.close()
+            raise
+
+    def _watch_tree(self, path: str, rel: str, found: List[Path] | None) -> None:
+        for dirpath, dirrel, _entries in self.tree.walk(path, rel, found):
+            wd = self._add_watch(self.fd, os.fsencode(dirpath), _WATCH_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue
+                # ENOSPC: fs.inotify.max_user_watches is too small for the tree.
+                raise WatchError(code, f"Cannot watch {dirpath}: {os.strerror(code)}")
+            self.dirs[wd] = (dirpath, dirrel)
+
+    def _forget(self, path: str) -> None:
+        prefix = path + os.sep
+        for wd, (dirpath, _rel) in list(self.dirs.items()):
+            if dirpath == path or dirpath.startswith(prefix):
+                self._rm_watch(self.fd, wd)
+                del self.dirs[wd]
+
+    def read(self, timeout: float) -> Tuple[List[Path], List[Path]]:
+        """Wait up to ``timeout`` seconds; return ``(landed, touched)`` files.
+
+        ``landed`` were closed after writing or renamed into place,
+        ``touched`` are still being written.
+        """
+        landed: List[Path] = []
+        touched: List[Path] = []
+        started = time.time_ns()
+        if not select.select([self.fd], [], [], max(0.0, timeout))[0]:
+            self._complete_before = started
+            return landed, touched
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + _EVENT.size : offset + _EVENT.size + length].rstrip(b"\0"))
+                offset += _EVENT.size + length
+                self._handle(wd, mask, name, landed, touched)
+        self._complete_before = started
+        return landed, touched
+
+    def _handle(self, wd: int, mask: int, name: str, landed: List[Path], touched: List[Path]) -> None:
+        if mask & _IN_Q_OVERFLOW:
+            # Events were dropped: list the trees once and pick up files
+            # modified since the last read that was known to be complete.
+            # Adding a watch that exists returns its descriptor, so this also
+            # catches directories whose creation event was lost.
+            print("[WATCH] inotify queue overflowed, rescanning", file=sys.stderr)
+            found: List[Path] = []
+            for root in self.tree.roots:
+                self._watch_tree(root, "", found)
+            cutoff = self._complete_before - MTIME_SLACK_NS
+            for path in found:
+                try:
+                    if path.stat().st_mtime_ns >= cutoff:
+                        landed.append(path)
+                except OSError:
+                    continue
+            return
+        if mask & _IN_IGNORED:
+            self.dirs.pop(wd, None)
+            return
+        if wd not in self.dirs:
+            return
+        dirpath, rel = self.dirs[wd]
+        if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+            # A directory renamed within the tree comes back as IN_MOVED_TO.
+            self._forget(dirpath)
+            return
+
+        path = os.path.join(dirpath, name)
+        if mask & _IN_ISDIR:
+            if mask & _IN_MOVED_FROM:
+                self._forget(path)
+            elif mask & (_IN_CREATE | _IN_MOVED_TO) and self.tree.recursive:
+                if not excluded_dir(f"{rel}{name}", self.tree.exclude):
+                    # Files written before the watch was in place are found by the listing.
+                    self._watch_tree(path, f"{rel}{name}/", landed)
+            return
+        if not self.tree.wanted(name, f"{rel}{name}"):
+            return
+        if mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+            landed.append(Path(path))
+        elif mask & (_IN_CREATE | _IN_MODIFY):
+            touched.append(Path(path))
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class _DirState:
+    __slots__ = ("rel", "mtime_ns", "listed_ns", "files", "subdirs")
+
+    def __init__(self, rel: str) -> None:
+        self.rel = rel
+        self.mtime_ns = -1
+        self.listed_ns = 0
+        self.files: Dict[str, Tuple[int, int]] = {}
+        self.subdirs: Set[str] = set()
+
+
+class _Poller:
+    """Portable fallback: one ``stat`` per directory per interval.
+
+    Only directories whose mtime moved are listed again, so the cost of a
+    quiet tree is its directory count, not its file count. Creating or
+    renaming a file updates the directory mtime; a file rewritten in place
+    without a rename is only seen by inotify.
+    """
+
+    def __init__(self, tree: _Tree, interval: float) -> None:
+        self.tree = tree
+        self.interval = interval
+        self.dirs: Dict[str, _DirState] = {}
+        self._next_poll = time.monotonic() + interval
+        for root in tree.roots:
+            self._list(root, "", None)
+
+    def _list(self, path: str, rel: str, found: List[Path] | None) -> None:
+        """(Re)list ``path``, recording new or changed wanted files in ``found``."""
+        try:
+            st = os.stat(path)
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            self._drop(path)
+            return
+
+        state = self.dirs.get(path) or self.dirs.setdefault(path, _DirState(rel))
+        state.mtime_ns = st.st_mtime_ns
+        state.listed_ns = time.time_ns()
+        files: Dict[str, Tuple[int, int]] = {}
+        subdirs: Set[str] = set()
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.tree.recursive and not excluded_dir(f"{rel}{entry.name}", self.tree.exclude):
+                        subdirs.add(entry.path)
+                    continue
+                if not (entry.is_file() and self.tree.wanted(entry.name, f"{rel}{entry.name}")):
+                    continue
+                est = entry.stat()
+            except OSError:
+                continue
+            sig = (est.st_size, est.st_mtime_ns)
+            files[entry.name] = sig
+            if found is not None and state.files.get(entry.name) != sig:
+                found.append(Path(entry.path))
+
+        for gone in state.subdirs - subdirs:
+            self._drop(gone)
+        for new in subdirs - state.subdirs:
+            if new not in self.dirs:
+                self._list(new, f"{rel}{os.path.basename(new)}/", found)
+        state.files = files
+        state.subdirs = subdirs
+
+    def _drop(self, path: str) -> None:
+        state = self.dirs.pop(path, None)
+        if state is not None:
+            for sub in state.subdirs:
+                self._drop(sub)
+
+    def read(self, timeout: float) -> Tuple[List[Path], List[Path]]:
+        landed: List[Path] = []
+        now = time.monotonic()
+        if now < self._next_poll:
+            time.sleep(max(0.0, min(timeout, self._next_poll - now)))
+            if time.monotonic() < self._next_poll:
+                return landed, []
+        self._next_poll = time.monotonic() + self.interval
+
+        for path in list(self.dirs):
+            state = self.dirs.get(path)
+            if state is None:
+                continue
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                self._drop(path)
+                continue
+            if mtime_ns != state.mtime_ns or state.listed_ns - mtime_ns < MTIME_SLACK_NS:
+                self._list(path, state.rel, landed)
+        return landed, []
+
+    def close(self) -> None:
+        self.dirs.clear()
+
+
+class Watcher:
+    """Reports JPEGs under ``roots`` that were created, rewritten or moved in, once they settle.
+
+    A file is only handed over after its size and mtime have been stable for
+    ``settle`` seconds, so copies still in progress are not converted half
+    written. Directories are listed once at start-up (and again only if the
+    kernel drops events); after that only changes are looked at.
+    """
+
+    def __init__(
+        self,
+        roots: Sequence[Path],
+        recursive: bool = True,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        mode: str = "auto",
+        settle: float = DEFAULT_SETTLE,
+        interval: float = DEFAULT_POLL_INTERVAL,
+        suffixes: Iterable[str] = JPEG_SUFFIXES,
+    ) -> None:
+        if mode not in WATCH_MODES:
+            raise ValueError(f"Unknown watch mode: {mode}")
+        tree = _Tree(roots, recursive, include, exclude, suffixes)
+        self.settle = settle
+        self.source: _Inotify | _Poller
+        if mode == "poll":
+            self.source = _Poller(tree, interval)
+        else:
+            try:
+                self.source = _Inotify(tree)
+            except WatchError as err:
+                if mode == "inotify":
+                    raise
+                print(f"[WATCH] {err}; falling back to polling", file=sys.stderr)
+                self.source = _Poller(tree, interval)
+        self.mode = "inotify" if isinstance(self.source, _Inotify) else "poll"
+        # path -> (size, mtime_ns, monotonic time the signature was first seen)
+        self.pending: Dict[Path, Tuple[int, int, float]] = {}
+
+    @property
+    def watched_dirs(self) -> int:
+        return len(self.source.dirs)
+
+    def wait(self, timeout: float) -> List[Path]:
+        """Block for at most ``timeout`` seconds and return files that have settled."""
+        if self.pending:
+            due = min(seen for _size, _mtime, seen in self.pending.values()) + self.settle
+            timeout = min(timeout, max(0.0, due - time.monotonic()))
+        landed, touched = self.source.read(timeout)
+        now = time.monotonic()
+        for path in landed:
+            self.pending.setdefault(path, (-1, -1, now))
+        for path in touched:
+            if path in self.pending:
+                self.pending[path] = (-1, -1, now)
+        return self._settled(now)
+
+    def _settled(self, now: float) -> List[Path]:
+        ready = []
+        for path, (size, mtime_ns, seen) in list(self.pending.items()):
+            try:
+                st = path.stat()
+            except OSError:
+                # Deleted or renamed away (e.g. a temporary upload name).
+                del self.pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns) or st.st_size == 0:
+                # Still growing, or created empty and not written yet.
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif now - seen >= self.settle:
+                del self.pending[path]
+                ready.append(path)
+        return ready
+
+    def close(self) -> None:
+        self.source.close()
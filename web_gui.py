@@ -3,21 +3,80 @@
 
 from __future__ import annotations
 
-import io
+import argparse
+import atexit
+import itertools
+import multiprocessing
+import os
 import secrets
+import shutil
+import tempfile
 import threading
 import zipfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Any
-
-from flask import Flask, Response, jsonify, render_template_string, request
-from PIL import Image
+from typing import Any, Callable, Iterable, Iterator
+
+from flask import Flask, Response, jsonify, render_template_string, request, send_file
+
+from admission import MemoryBudget, estimate_source
+from cache import DEFAULT_CACHE_DIR, OutputCache, open_cache
+from engine import (
+    AVIF_SUBSAMPLING,
+    EFFORT_PRESETS,
+    JPEG_SUFFIXES,
+    THREAD_POLICIES,
+    EncodeSettings,
+    Size,
+    convert_bytes,
+    has_avif_encoder,
+    parse_max_dimension,
+    parse_size_bytes,
+    parse_ssim,
+    plan_threads,
+)
+from jobstore import DEFAULT_DOWNLOAD_TTL, DEFAULT_TTL, JobGone, JobStore
+from profiling import Profiler, profiled
+from scheduler import SMALL_JOB, FairScheduler
+from shared_payload import Handle, convert_shared, discard_shared, put_shared, take_shared
 
 app = Flask(__name__)
 
-JOBS: dict[str, dict[str, Any]] = {}
-JOBS_LOCK = threading.Lock()
+# Finished ZIPs are bounded in age and total bytes; main() applies the CLI limits.
+JOBS = JobStore(parse_size_bytes("10GB"))
+# Finished ZIPs live on disk in a private directory under this one (default:
+# the system temp dir) and are served as files.
+SPOOL_ROOT: str | None = None
+SPOOL_DIR: Path | None = None
+SPOOL_LOCK = threading.Lock()
+# WebP and AVIF are already entropy-coded, so deflating them costs CPU for no
+# gain; entries are stored unless --zip-compression deflated is given.
+ZIP_COMPRESSIONS = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+ZIP_COMPRESSION = zipfile.ZIP_STORED
+
+# "thread" converts on a long-lived thread pool in this process; "process"
+# hands work to a long-lived process pool. Either pool is shared by every job
+# and warmed by main(), which also configures all of these.
+BACKEND = "thread"
+THREAD_WORKERS = os.cpu_count() or 1
+PROCESS_WORKERS = os.cpu_count() or 1
+# Pool sizes and AVIF encoder threads are planned together against this budget.
+CPU_BUDGET = os.cpu_count() or 1
+THREAD_POLICY = "throughput"
+# Shared content-addressed output cache, enabled with --cache.
+CACHE: OutputCache | None = None
+# Server-wide cap on the estimated peak memory of in-flight conversions.
+MEMORY_BUDGET: MemoryBudget | None = None
+# Server-lifetime stage profile, enabled with --profile and served at /profile.
+PROFILER: Profiler | None = None
+THREAD_POOL: ThreadPoolExecutor | None = None
+THREAD_POOL_LOCK = threading.Lock()
+PROCESS_POOL: ProcessPoolExecutor | None = None
+PROCESS_POOL_LOCK = threading.Lock()
+# Shares CPU_BUDGET between jobs, so concurrent jobs take turns on the pool
+# instead of queueing behind each other; main() rebuilds it from the CLI.
+SCHEDULER = FairScheduler(CPU_BUDGET)
 
 HTML = """
 <!doctype html>
@@ -132,6 +191,15 @@ HTML = """
       font-size: 0.92rem;
       color: var(--muted);
     }
+    .notes {
+      margin-top: 8px;
+      max-height: 160px;
+      overflow-y: auto;
+      font-family: ui-monospace, monospace;
+      font-size: 0.85rem;
+      color: var(--muted);
+      white-space: pre-line;
+    }
     .success {
       margin-top: 10px;
       color: var(--ok);
@@ -178,6 +246,50 @@ HTML = """
           <label for="workers">Parallel jobs (1-32)</label>
           <input id="workers" name="workers" type="number" min="1" max="32" value="12" />
         </div>
+
+        <div>
+          <label for="max_dimension">Max size (optional)</label>
+          <input id="max_dimension" name="max_dimension" type="text" placeholder="1600 or 1600x1200" />
+        </div>
+
+        <div>
+          <label for="target_size">Target size (optional)</label>
+          <input id="target_size" name="target_size" type="text" placeholder="150KB" />
+        </div>
+
+        <div>
+          <label for="target_ssim">Target SSIM (optional)</label>
+          <input id="target_ssim" name="target_ssim" type="text" placeholder="0.99" />
+        </div>
+
+        <div>
+          <label for="preset">Encoder preset</label>
+          <select id="preset" name="preset">
+            <option value="fastest">Fastest (previews)</option>
+            <option value="balanced" selected>Balanced</option>
+            <option value="smallest">Smallest (final catalog)</option>
+          </select>
+        </div>
+
+        <div>
+          <label for="webp_method">WebP method (0-6, optional)</label>
+          <input id="webp_method" name="webp_method" type="number" min="0" max="6" placeholder="preset" />
+        </div>
+
+        <div>
+          <label for="avif_speed">AVIF speed (0-10, optional)</label>
+          <input id="avif_speed" name="avif_speed" type="number" min="0" max="10" placeholder="preset" />
+        </div>
+
+        <div>
+          <label for="avif_subsampling">AVIF subsampling</label>
+          <select id="avif_subsampling" name="avif_subsampling">
+            <option value="" selected>Preset</option>
+            <option value="4:2:0">4:2:0</option>
+            <option value="4:2:2">4:2:2</option>
+            <option value="4:4:4">4:4:4</option>
+          </select>
+        </div>
       </div>
 
       <button id="submitBtn" type="submit">Convert</button>
@@ -188,6 +300,7 @@ HTML = """
         <div id="statusText" class="status">Idle</div>
       </div>
 
+      <div id="notesList" class="notes" style="display:none;"></div>
       <div id="successText" class="success" style="display:none;"></div>
       <div id="errorText" class="error" style="display:none;"></div>
     </form>
@@ -201,6 +314,7 @@ HTML = """
     const submitBtn = document.getElementById('submitBtn');
     const barFill = document.getElementById('barFill');
     const statusText = document.getElementById('statusText');
+    const notesList = document.getElementById('notesList');
     const successText = document.getElementById('successText');
     const errorText = document.getElementById('errorText');
 
@@ -214,6 +328,8 @@ HTML = """
       errorText.textContent = '';
       successText.style.display = 'none';
       successText.textContent = '';
+      notesList.style.display = 'none';
+      notesList.textContent = '';
     }
 
     function updateFileMeta() {
@@ -253,15 +369,23 @@ HTML = """
     });
 
     async function pollStatus(jobId) {
+      let notesShown = 0;
       while (true) {
-        const res = await fetch(`/status/${jobId}`);
+        const res = await fetch(`/status/${jobId}?notes=${notesShown}`);
+        const data = await res.json().catch(() => ({}));
         if (!res.ok) {
-          throw new Error('Status check failed.');
+          throw new Error(data.error || 'Status check failed.');
         }
-        const data = await res.json();
         const pct = data.total > 0 ? Math.round((data.completed / data.total) * 100) : 0;
         barFill.style.width = `${pct}%`;
-        statusText.textContent = `${data.state}: ${data.completed}/${data.total} (${pct}%)`;
+        statusText.textContent = data.queue_position
+          ? `queued: position ${data.queue_position}`
+          : `${data.state}: ${data.completed}/${data.total} (${pct}%)`;
+        for (const item of data.notes || []) {
+          notesList.style.display = 'block';
+          notesList.textContent += `${item.name}: ${item.note}\n`;
+          notesShown += 1;
+        }
 
         if (data.state === 'done') {
           successText.style.display = 'block';
@@ -312,75 +436,257 @@ HTML = """
 """
 
 
-def avif_available() -> bool:
+def convert_one(
+    raw: bytes, filename: str, fmt: str, settings: EncodeSettings, max_size: Size | None = None
+) -> tuple[str, bytes, str]:
+    (result,) = convert_bytes(raw, filename, [fmt], settings, max_size, CACHE)
+    return str(result.dest), result.data, result.note
+
+
+def thread_pool() -> ThreadPoolExecutor:
+    global THREAD_POOL
+    with THREAD_POOL_LOCK:
+        if THREAD_POOL is None:
+            THREAD_POOL = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="convert")
+        return THREAD_POOL
+
+
+def process_pool() -> ProcessPoolExecutor:
+    global PROCESS_POOL
+    with PROCESS_POOL_LOCK:
+        if PROCESS_POOL is None:
+            # Spawned workers avoid forking a multi-threaded Flask server.
+            PROCESS_POOL = ProcessPoolExecutor(
+                max_workers=PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return PROCESS_POOL
+
+
+def spool_dir() -> Path:
+    """This server's spool directory, created on first use and removed at exit."""
+    global SPOOL_DIR
+    with SPOOL_LOCK:
+        if SPOOL_DIR is None:
+            SPOOL_DIR = Path(tempfile.mkdtemp(prefix="jpg-to-webp-jobs-", dir=SPOOL_ROOT))
+            atexit.register(shutil.rmtree, SPOOL_DIR, True)
+        return SPOOL_DIR
+
+
+def warm_pool() -> None:
+    """Start every worker of the configured backend's pool before the first job arrives."""
+    if BACKEND == "process":
+        pool: Executor = process_pool()
+        workers = PROCESS_WORKERS
+        for future in [pool.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+    else:
+        # Threads are only added while none is idle, so hold each one at a
+        # barrier until all of them exist.
+        pool = thread_pool()
+        barrier = threading.Barrier(THREAD_WORKERS)
+        for future in [pool.submit(barrier.wait) for _ in range(THREAD_WORKERS)]:
+            future.result()
+
+
+def reset_process_pool(broken: ProcessPoolExecutor) -> None:
+    # A worker died (e.g. OOM-killed); let the next job start a fresh pool.
+    global PROCESS_POOL
+    with PROCESS_POOL_LOCK:
+        if PROCESS_POOL is broken:
+            PROCESS_POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def submit_admitted(pool: Executor, raw: bytes, fmt: str, max_size: Size | None, fn, *args: Any) -> Future:
+    """Submit ``fn`` once the server-wide memory budget can hold this image."""
+    if MEMORY_BUDGET is None:
+        return pool.submit(fn, *args)
+
+    budget = MEMORY_BUDGET
+    held = budget.acquire(estimate_source(raw, [fmt], max_size))
     try:
-        buf = io.BytesIO()
-        Image.new("RGB", (1, 1), color=(0, 0, 0)).save(buf, format="AVIF")
-        return True
-    except Exception:
-        return False
-
-
-def convert_one(raw: bytes, filename: str, fmt: str, quality: int) -> tuple[str, bytes]:
-    stem = Path(filename).stem
-    out_name = f"{stem}.webp" if fmt == "webp" else f"{stem}.avif"
-
-    with Image.open(io.BytesIO(raw)) as im:
-        out = io.BytesIO()
-        im.convert("RGB").save(out, format=fmt.upper(), quality=quality)
-        return out_name, out.getvalue()
-
-
-def set_job(job_id: str, **kwargs: Any) -> None:
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return
-        job.update(kwargs)
-
+        fut = pool.submit(fn, *args)
+    except BaseException:
+        budget.release(held)
+        raise
+    fut.add_done_callback(lambda _f: budget.release(held))
+    return fut
+
+
+def scheduled(job_id: str, submit: Callable[[Any], Future]) -> Callable[[Any], Future]:
+    """Wrap ``submit`` so each conversion first waits for ``job_id``'s turn with the scheduler."""
+
+    def run(item: Any) -> Future:
+        if SCHEDULER.acquire(job_id):
+            JOBS.update(job_id, state="running")
+        try:
+            fut = submit(item)
+        except BaseException:
+            SCHEDULER.release(job_id)
+            raise
+        fut.add_done_callback(lambda _f: SCHEDULER.release(job_id))
+        return fut
+
+    return run
+
+
+def iter_windowed(
+    submit: Callable[[Any], Future], items: Iterable[Any], window: int, running: set[Future]
+) -> Iterator[Future]:
+    """Submit ``items`` keeping at most ``window`` in ``running``, and yield each future once it is done.
+
+    Finished slots are refilled before their results are handed out, so the
+    pool stays busy while the caller consumes them.
+    """
+    items = iter(items)
+    for item in itertools.islice(items, window):
+        running.add(submit(item))
+    while running:
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        running.difference_update(done)
+        for item in itertools.islice(items, len(done)):
+            running.add(submit(item))
+        yield from done
+
+
+def iter_converted_threads(
+    job_id: str, tasks: list[tuple[str, bytes, str]], settings: EncodeSettings, max_size: Size | None, window: int
+) -> Iterator[tuple[str, bytes, str]]:
+    pool = thread_pool()
+    profiler = PROFILER
+
+    def submit(task: tuple[str, bytes, str]) -> Future:
+        name, raw, one_fmt = task
+        if profiler is None:
+            return submit_admitted(pool, raw, one_fmt, max_size, convert_one, raw, name, one_fmt, settings, max_size)
+        return submit_admitted(
+            pool, raw, one_fmt, max_size, profiler.call, convert_one, raw, name, one_fmt, settings, max_size
+        )
 
-def run_job(job_id: str, payloads: list[tuple[str, bytes]], fmt: str, quality: int, workers: int) -> None:
+    running: set[Future] = set()
+    try:
+        for fut in iter_windowed(scheduled(job_id, submit), tasks, window, running):
+            yield fut.result()
+    finally:
+        for fut in running:
+            fut.cancel()
+
+
+def iter_converted_processes(
+    job_id: str, tasks: list[tuple[str, bytes, str]], settings: EncodeSettings, max_size: Size | None, window: int
+) -> Iterator[tuple[str, bytes, str]]:
+    # Uploads and encoded outputs travel through shared memory; only the
+    # segment names and sizes are pickled.
+    pool = process_pool()
+    profiler = PROFILER
+    inputs: dict[Future, Handle] = {}
+
+    def submit(task: tuple[str, bytes, str]) -> Future:
+        name, raw, one_fmt = task
+        handle = put_shared(raw)
+        args = (convert_shared, handle, name, one_fmt, settings, max_size, CACHE)
+        if profiler is not None:
+            # Spans are recorded in the worker and come back with the result.
+            args = (profiled,) + args
+        try:
+            fut = submit_admitted(pool, raw, one_fmt, max_size, *args)
+        except BaseException:
+            discard_shared(handle)
+            raise
+        inputs[fut] = handle
+        return fut
+
+    running: set[Future] = set()
+    try:
+        for fut in iter_windowed(scheduled(job_id, submit), tasks, window, running):
+            discard_shared(inputs.pop(fut))
+            result = fut.result()
+            if profiler is not None:
+                result, trace = result
+                profiler.add(trace)
+            out_name, out_handle, out_note = result
+            yield out_name, take_shared(out_handle), out_note
+    except BrokenProcessPool:
+        reset_process_pool(pool)
+        raise
+    finally:
+        for fut, handle in inputs.items():
+            if not fut.cancel():
+                try:
+                    result = fut.result()
+                    discard_shared((result[0] if profiler is not None else result)[1])
+                except Exception:
+                    pass
+            discard_shared(handle)
+
+
+def run_job(
+    job_id: str,
+    payloads: list[tuple[str, bytes]],
+    fmt: str,
+    quality: int,
+    workers: int,
+    max_size: Size | None = None,
+    preset: str = "balanced",
+    overrides: dict[str, Any] | None = None,
+) -> None:
+    # Entries are appended as conversions complete, under a temporary name so
+    # a half-built ZIP is never served.
+    part: Path | None = spool_dir() / f"{job_id}.zip.part"
     try:
-        results: list[tuple[str, bytes]] = []
         name_counts: dict[str, int] = {}
 
-        # Chunking keeps large batches stable by limiting futures in-flight.
-        chunk_size = 24
+        # The job keeps at most ``window`` conversions in flight on the shared
+        # pool, refilling each slot as soon as the scheduler gives it a turn.
+        # The form's Parallel jobs is a per-job limit within the pool's size.
+        pool_workers = min(workers, PROCESS_WORKERS if BACKEND == "process" else THREAD_WORKERS)
+        window, encoder_threads = plan_threads(pool_workers, THREAD_POLICY, CPU_BUDGET, [fmt])
+        settings = EncodeSettings.from_preset(
+            preset, quality=quality, max_threads=encoder_threads, **(overrides or {})
+        )
         tasks = [(name, raw, fmt) for name, raw in payloads]
 
         completed = 0
         total = len(tasks)
-        set_job(job_id, state="running", completed=0, total=total)
-
-        for idx in range(0, total, chunk_size):
-            chunk = tasks[idx : idx + chunk_size]
-            with ThreadPoolExecutor(max_workers=workers) as pool:
-                futures = [pool.submit(convert_one, raw, name, one_fmt, quality) for name, raw, one_fmt in chunk]
-                for fut in as_completed(futures):
-                    out_name, out_data = fut.result()
-
-                    if out_name in name_counts:
-                        name_counts[out_name] += 1
-                        stem = Path(out_name).stem
-                        ext = Path(out_name).suffix
-                        safe_name = f"{stem}_{name_counts[out_name]}{ext}"
-                    else:
-                        name_counts[out_name] = 1
-                        safe_name = out_name
-
-                    results.append((safe_name, out_data))
-                    completed += 1
-                    set_job(job_id, completed=completed)
-
-        zip_buf = io.BytesIO()
-        with zipfile.ZipFile(zip_buf, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-            for out_name, out_data in sorted(results):
-                zf.writestr(out_name, out_data)
-
-        zip_buf.seek(0)
-        set_job(job_id, state="done", zip_bytes=zip_buf.getvalue(), completed=total)
+        # (ZIP entry, note) pairs, e.g. the quality and score a target picked.
+        notes: list[tuple[str, str]] = []
+        JOBS.update(job_id, completed=0, total=total, notes=notes)
+        SCHEDULER.add(job_id, total, cost=encoder_threads)
+
+        with zipfile.ZipFile(part, mode="w", compression=ZIP_COMPRESSION, allowZip64=True) as zf:
+            if BACKEND == "process":
+                converted = iter_converted_processes(job_id, tasks, settings, max_size, window)
+            else:
+                converted = iter_converted_threads(job_id, tasks, settings, max_size, window)
+
+            for out_name, out_data, out_note in converted:
+                if out_name in name_counts:
+                    name_counts[out_name] += 1
+                    stem = Path(out_name).stem
+                    ext = Path(out_name).suffix
+                    safe_name = f"{stem}_{name_counts[out_name]}{ext}"
+                else:
+                    name_counts[out_name] = 1
+                    safe_name = out_name
+
+                zf.writestr(safe_name, out_data)
+                if out_note:
+                    notes.append((safe_name, out_note))
+                completed += 1
+                JOBS.update(job_id, completed=completed)
+
+        artifact = part.with_suffix("")
+        os.replace(part, artifact)
+        part = None
+
+        JOBS.finish(job_id, artifact, completed=total)
     except Exception as err:
-        set_job(job_id, state="error", error=str(err))
+        if part is not None:
+            part.unlink(missing_ok=True)
+        JOBS.fail(job_id, str(err))
+    finally:
+        SCHEDULER.remove(job_id)
 
 
 @app.route("/", methods=["GET"])
@@ -398,7 +704,7 @@ def start() -> tuple[Response, int] | Response:
     if fmt not in {"webp", "avif"}:
         return jsonify({"error": "Invalid format selected."}), 400
 
-    if fmt == "avif" and not avif_available():
+    if fmt == "avif" and not has_avif_encoder():
         return jsonify({"error": "AVIF encoding is not available in your Pillow build."}), 400
 
     try:
@@ -415,10 +721,56 @@ def start() -> tuple[Response, int] | Response:
     except ValueError:
         return jsonify({"error": "Parallel jobs must be between 1 and 32."}), 400
 
+    try:
+        max_size = parse_max_dimension(request.form.get("max_dimension", ""))
+    except ValueError as err:
+        return jsonify({"error": str(err)}), 400
+
+    preset = request.form.get("preset", "balanced")
+    if preset not in EFFORT_PRESETS:
+        return jsonify({"error": "Invalid encoder preset."}), 400
+
+    overrides: dict[str, Any] = {}
+    for field, key, low, high, label in (
+        ("webp_method", "method", 0, 6, "WebP method"),
+        ("avif_speed", "speed", 0, 10, "AVIF speed"),
+    ):
+        raw = request.form.get(field, "").strip()
+        if not raw:
+            continue
+        try:
+            overrides[key] = int(raw)
+            if not low <= overrides[key] <= high:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": f"{label} must be between {low} and {high}."}), 400
+
+    subsampling = request.form.get("avif_subsampling", "").strip()
+    if subsampling:
+        if subsampling not in AVIF_SUBSAMPLING:
+            return jsonify({"error": "Invalid AVIF subsampling."}), 400
+        overrides["subsampling"] = subsampling
+
+    target_size = request.form.get("target_size", "").strip()
+    if target_size:
+        try:
+            overrides["target_bytes"] = parse_size_bytes(target_size)
+        except ValueError as err:
+            return jsonify({"error": str(err)}), 400
+
+    target_ssim = request.form.get("target_ssim", "").strip()
+    if target_ssim:
+        if target_size:
+            return jsonify({"error": "Use either a target size or a target SSIM, not both."}), 400
+        try:
+            overrides["target_ssim"] = parse_ssim(target_ssim)
+        except ValueError as err:
+            return jsonify({"error": str(err)}), 400
+
     payloads: list[tuple[str, bytes]] = []
     for f in files:
         name = f.filename or "image.jpg"
-        if Path(name).suffix.lower() not in {".jpg", ".jpeg"}:
+        if Path(name).suffix.lower() not in JPEG_SUFFIXES:
             continue
         payloads.append((name, f.read()))
 
@@ -426,19 +778,11 @@ def start() -> tuple[Response, int] | Response:
         return jsonify({"error": "No valid .jpg/.jpeg files were uploaded."}), 400
 
     job_id = secrets.token_urlsafe(10)
-    with JOBS_LOCK:
-        JOBS[job_id] = {
-            "state": "queued",
-            "completed": 0,
-            "total": len(payloads),
-            "error": None,
-            "zip_bytes": None,
-            "format": fmt,
-        }
+    JOBS.create(job_id, total=len(payloads), format=fmt)
 
     thread = threading.Thread(
         target=run_job,
-        args=(job_id, payloads, fmt, quality, workers),
+        args=(job_id, payloads, fmt, quality, workers, max_size, preset, overrides),
         daemon=True,
     )
     thread.start()
@@ -446,38 +790,197 @@ def start() -> tuple[Response, int] | Response:
     return jsonify({"job_id": job_id})
 
 
+def gone(err: JobGone) -> tuple[Response, int]:
+    if err.reason == "evicted":
+        message = "This job's results were evicted to free server memory. Please convert the images again."
+    else:
+        message = "This job has expired. Please convert the images again."
+    return jsonify({"error": message, "state": err.reason}), 410
+
+
 @app.route("/status/<job_id>", methods=["GET"])
 def status(job_id: str) -> tuple[Response, int] | Response:
-    with JOBS_LOCK:
+    try:
         job = JOBS.get(job_id)
-        if not job:
-            return jsonify({"error": "Job not found."}), 404
-        return jsonify(
-            {
-                "state": job["state"],
-                "completed": job["completed"],
-                "total": job["total"],
-                "error": job.get("error"),
-            }
-        )
+    except JobGone as err:
+        return gone(err)
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    # Notes are append-only; the page passes how many it has already shown.
+    seen = request.args.get("notes", "0")
+    seen_count = int(seen) if seen.isdigit() else 0
+    return jsonify(
+        {
+            "state": job["state"],
+            "completed": job["completed"],
+            "total": job["total"],
+            "error": job.get("error"),
+            "queue_position": SCHEDULER.position(job_id),
+            "notes": [{"name": name, "note": note} for name, note in job.get("notes", [])[seen_count:]],
+        }
+    )
+
+
+@app.route("/jobs/stats", methods=["GET"])
+def job_stats() -> tuple[Response, int] | Response:
+    return jsonify({**JOBS.stats(), "scheduler": SCHEDULER.stats()})
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats() -> tuple[Response, int] | Response:
+    if CACHE is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **CACHE.stats()})
+
+
+@app.route("/profile", methods=["GET"])
+def profile() -> tuple[Response, int] | Response:
+    if PROFILER is None:
+        return jsonify({"enabled": False})
+    if request.args.get("format") == "chrome":
+        return jsonify(PROFILER.chrome_trace())
+    return jsonify({"enabled": True, **PROFILER.stats()})
 
 
 @app.route("/download/<job_id>", methods=["GET"])
 def download(job_id: str) -> tuple[Response, int] | Response:
-    with JOBS_LOCK:
-        job = JOBS.get(job_id)
-        if not job:
-            return jsonify({"error": "Job not found."}), 404
-        if job["state"] != "done" or not job.get("zip_bytes"):
-            return jsonify({"error": "Job is not ready yet."}), 400
-        data = job["zip_bytes"]
-
-    return Response(
-        data,
-        mimetype="application/zip",
-        headers={"Content-Disposition": "attachment; filename=converted_images.zip"},
+    try:
+        job = JOBS.download(job_id)
+    except JobGone as err:
+        return gone(err)
+    if not job:
+        return jsonify({"error": "Job not found."}), 404
+    if job["state"] != "done":
+        return jsonify({"error": "Job is not ready yet."}), 400
+
+    # Served from disk: Content-Length, an ETag and Range requests come from
+    # send_file, and WSGI servers with a file wrapper hand the file to sendfile.
+    try:
+        return send_file(
+            job["artifact"],
+            mimetype="application/zip",
+            as_attachment=True,
+            download_name="converted_images.zip",
+            conditional=True,
+            etag=True,
+            max_age=0,
+        )
+    except FileNotFoundError:
+        # Reaped between the lookup and the open.
+        return gone(JobGone(job_id, "expired"))
+
+
+def main() -> None:
+    global BACKEND, THREAD_WORKERS, PROCESS_WORKERS, CPU_BUDGET, THREAD_POLICY, CACHE, MEMORY_BUDGET, PROFILER
+    global JOBS, SPOOL_ROOT, ZIP_COMPRESSION, SCHEDULER
+
+    parser = argparse.ArgumentParser(description="Browser GUI for JPG/JPEG to WebP/AVIF conversion.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=5000, help="Port to listen on (default: 5000).")
+    parser.add_argument(
+        "--backend",
+        choices=["thread", "process"],
+        default="thread",
+        help=(
+            "Run conversions on a shared, pre-warmed server-wide thread pool, or on a "
+            "server-wide process pool fed through shared memory (default: thread)."
+        ),
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=PROCESS_WORKERS,
+        help="Worker processes for --backend process (default: CPU count).",
+    )
+    parser.add_argument(
+        "--cpu-budget",
+        type=int,
+        default=CPU_BUDGET,
+        help="CPUs shared by conversion workers and AVIF encoder threads (default: all).",
+    )
+    parser.add_argument(
+        "--thread-policy",
+        choices=list(THREAD_POLICIES),
+        default=THREAD_POLICY,
+        help="'throughput' for many lightly threaded encodes, 'latency' for few heavily threaded ones.",
+    )
+    parser.add_argument("--cache", action="store_true", help="Reuse encodes from the shared output cache.")
+    parser.add_argument(
+        "--cache-dir",
+        default=str(DEFAULT_CACHE_DIR),
+        help="Output cache directory, shared with the CLI and Tk GUI (default: %(default)s).",
+    )
+    parser.add_argument("--cache-size", default="2GB", help="Output cache size limit (default: 2GB).")
+    parser.add_argument(
+        "--memory-budget",
+        default=None,
+        help=(
+            "Admit conversions across all jobs only while their estimated peak memory "
+            "fits this budget, e.g. 6GB (default: unlimited)."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time every conversion stage and serve totals, histograms and a Chrome trace at /profile.",
+    )
+    parser.add_argument(
+        "--job-ttl",
+        type=float,
+        default=DEFAULT_TTL / 60,
+        help="Minutes a finished job's ZIP is kept (default: %(default)g).",
+    )
+    parser.add_argument(
+        "--download-ttl",
+        type=float,
+        default=DEFAULT_DOWNLOAD_TTL / 60,
+        help="Minutes a ZIP is kept after its first download, for retries (default: %(default)g).",
+    )
+    parser.add_argument(
+        "--job-store-size",
+        default="10GB",
+        help="Cap on finished ZIPs kept in the spool; least recently used ones are evicted (default: 10GB).",
+    )
+    parser.add_argument(
+        "--spool-dir",
+        default=None,
+        help="Directory for finished ZIPs, served from disk (default: the system temp directory).",
+    )
+    parser.add_argument(
+        "--zip-compression",
+        choices=list(ZIP_COMPRESSIONS),
+        default="stored",
+        help="How ZIP entries are written; WebP/AVIF gain nothing from deflate (default: stored).",
+    )
+    parser.add_argument(
+        "--small-job",
+        type=int,
+        default=SMALL_JOB,
+        help="Jobs with at most this many images go ahead of larger ones (default: %(default)s).",
     )
+    args = parser.parse_args()
+
+    ZIP_COMPRESSION = ZIP_COMPRESSIONS[args.zip_compression]
+    JOBS = JobStore(parse_size_bytes(args.job_store_size), ttl=args.job_ttl * 60, download_ttl=args.download_ttl * 60)
+    JOBS.start_reaper()
+    SPOOL_ROOT = args.spool_dir
+    if args.profile:
+        PROFILER = Profiler()
+    if args.memory_budget:
+        MEMORY_BUDGET = MemoryBudget(parse_size_bytes(args.memory_budget))
+    if args.cache:
+        CACHE = open_cache(Path(args.cache_dir), parse_size_bytes(args.cache_size))
+    BACKEND = args.backend
+    CPU_BUDGET = max(1, args.cpu_budget)
+    THREAD_POLICY = args.thread_policy
+    # Pools serve every format; each AVIF job's share of the budget is
+    # enforced per conversion by the scheduler.
+    PROCESS_WORKERS, _ = plan_threads(args.processes, THREAD_POLICY, CPU_BUDGET, ["webp"])
+    THREAD_WORKERS, _ = plan_threads(CPU_BUDGET, THREAD_POLICY, CPU_BUDGET, ["webp"])
+    SCHEDULER = FairScheduler(CPU_BUDGET, small_job=args.small_job)
+    warm_pool()
+    app.run(host=args.host, port=args.port, debug=False)
 
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5000, debug=False)
+    main()